@@ -5,6 +5,9 @@ Created on Jun 11, 2018
 '''
 
 
+import numpy as np
+
+
 def feature(root, suffix):
     """Return the last char of root and the first char of suffix (the interface between the root and the suffix).
 
@@ -16,67 +19,161 @@ def feature(root, suffix):
 
 
 def get_initial_parameters(token_segs):
-    """Calculates the probabilities of roots, suffixes, and transitions given their frequency in `token_segs`.
+    """Calculates the probabilities of roots, suffixes, and transitions given their frequency in `token_segs` (a
+    CandidateLattice).
+
+    This is explained in section 5 from the paper, and is GetPrior in the algorithm. The probabilities are keyed by the
+    symbol ids of the lattice: roots by root id, suffixes by suffix id, and transitions by (trans id, feature id).
+    """
+    return normalize_initial_parameters(count_initial_parameters(token_segs))
+
+
+def count_initial_parameters(token_segs, counts=None):
+    """Collect the unnormalized probabilities used by get_initial_parameters from `token_segs` (a CandidateLattice).
+
+    If `counts` (a PriorCounts, as returned by this function) is given, add to it instead of starting over. This way
+    the counts can be accumulated one batch of tokens at a time.
+    """
+    if counts is None:
+        counts = PriorCounts()
+    counts.add(token_segs)
+    return counts
+
+
+def normalize_initial_parameters(counts):
+    """Divide the counts from count_initial_parameters by their totals, giving the probabilities of roots, suffixes,
+    and transitions as dictionaries keyed by symbol ids."""
+    probstems, probsuffix, probtrans = counts.normalize()
+    probstems = _array_to_prob_dict(probstems)
+    probsuffix = _array_to_prob_dict(probsuffix)
+    # only the transitions that were seen (and not removed since) are kept
+    trans_dict = {}
+    for trans, ftrans, prob in zip(counts.pair_trans, counts.pair_feats, probtrans.tolist()):
+        if prob:
+            trans_dict[(trans, ftrans)] = prob
+    return probstems, probsuffix, trans_dict
+
+
+PAIR_BASE = 1 << 32  # (trans id, feature id) pairs are encoded as trans id * PAIR_BASE + feature id
+REMOVED_COUNT_TOLERANCE = 1e-9  # counts smaller than this after candidates are removed are rounding errors
+
+
+class PriorCounts():
+    """The unnormalized probabilities of GetPrior, accumulated in arrays over one or more CandidateLattices.
 
-    This is explained in section 5 from the paper, and is GetPrior in the algorithm.
+    Roots, suffixes, and features are counted in arrays indexed by symbol id, and (transition, feature) pairs in an
+    array indexed in the order the pairs were added: by lattice, and sorted by (trans id, feature id) within each
+    lattice. That order only decides the order of the transition probabilities of normalize_initial_parameters, not
+    their values. Each candidate adds the average probability of its token's candidates, in the order of the
+    candidates.
     """
-    estems = {}  # tracks the average probability of each root
-    esuffix = {}  # tracks the average probability of each suffix
-    etrans = {}  # tracks the average probability of each (transition, feature) pair
-    eftrans = {}  # tracks the average probability of each feature (interface between stem and suffix)
-
-    # collect the probabilities of each object, to be normalized (divided by their totals) later
-    for ts_list in token_segs:
-        avg_prob = 1.0 / len(ts_list)
-        for ts in ts_list:
-            root = ts.root
-            rand_val = 1.0
-            if root in estems:
-                estems[root] += rand_val * avg_prob
-            else: estems[root] = rand_val * avg_prob
-
-            suffix = ts.suffix
-            if suffix in esuffix:
-                esuffix[suffix] += rand_val * avg_prob
-            else: esuffix[suffix] = rand_val * avg_prob
-
-            trans = ts.trans
-            ftrans = feature(root, suffix)
-            if (trans, ftrans) in etrans:
-                etrans[(trans, ftrans)] += rand_val * avg_prob
-            else: etrans[(trans, ftrans)] = rand_val * avg_prob
-
-            if ftrans in eftrans:
-                eftrans[ftrans] += rand_val * avg_prob
-            else: eftrans[ftrans] = rand_val * avg_prob
-
-    # divide by the totals
-    probstems = estems
-    probsum = sum(probstems.values())
-    for stem in probstems:
-        probstems[stem] /= probsum
-
-    probsuffix = esuffix
-    probsum = sum(probsuffix.values())
-    for suffix in probsuffix:
-        probsuffix[suffix] /= probsum
-
-    probtrans = etrans
-    for trans, ftrans in probtrans:
-        probtrans[(trans, ftrans)] /= eftrans[ftrans]
-
-    return probstems, probsuffix, probtrans
-
-
-def calc_seg_prob(ts, probroots, probsuffix, probtrans):
+
+    def __init__(self):
+        """Start with no counts."""
+        self.estems = np.zeros(0)  # tracks the average probability of each root
+        self.esuffix = np.zeros(0)  # tracks the average probability of each suffix
+        self.etrans = np.zeros(0)  # tracks the average probability of each (transition, feature) pair
+        self.eftrans = np.zeros(0)  # tracks the average probability of each feature (interface between stem and suffix)
+        self.pair_index = {}  # maps each encoded (transition, feature) pair to its index in etrans
+        self.pair_trans = []  # the transition of each pair
+        self.pair_feats = []  # the feature of each pair
+
+    def add(self, token_segs, sign=1.0):
+        """Add the counts of the candidates in `token_segs` (or subtract them, if `sign` is -1)."""
+        num_symbols = len(token_segs.symbols)
+        self.estems = _grow(self.estems, num_symbols)
+        self.esuffix = _grow(self.esuffix, num_symbols)
+        self.eftrans = _grow(self.eftrans, num_symbols)
+
+        root_ids, trans_ids, suffix_ids, feat_ids, seg_counts = _lattice_arrays(token_segs)
+        avg_probs = np.repeat(sign / seg_counts, seg_counts)
+        # np.add.at adds in order, so the sums are the same as adding up one candidate at a time
+        np.add.at(self.estems, root_ids, avg_probs)
+        np.add.at(self.esuffix, suffix_ids, avg_probs)
+        np.add.at(self.eftrans, feat_ids, avg_probs)
+
+        # give each new (transition, feature) pair an index
+        pair_codes, pair_inverse = np.unique(trans_ids.astype(np.int64) * PAIR_BASE + feat_ids, return_inverse=True)
+        pair_indices = np.empty(len(pair_codes), dtype=np.int64)
+        for i, code in enumerate(pair_codes.tolist()):
+            index = self.pair_index.get(code)
+            if index is None:
+                index = len(self.pair_trans)
+                self.pair_index[code] = index
+                self.pair_trans.append(code // PAIR_BASE)
+                self.pair_feats.append(code % PAIR_BASE)
+            pair_indices[i] = index
+        self.etrans = _grow(self.etrans, len(self.pair_trans))
+        np.add.at(self.etrans, pair_indices[pair_inverse.ravel()], avg_probs)
+
+    def remove(self, token_segs):
+        """Subtract the counts of the candidates in `token_segs`, which must have been added before."""
+        self.add(token_segs, -1.0)
+        # what's left of the counts of roots, suffixes, and pairs that are gone is rounding error
+        for counts in (self.estems, self.esuffix, self.etrans, self.eftrans):
+            counts[np.abs(counts) < REMOVED_COUNT_TOLERANCE] = 0.0
+
+    def normalize(self):
+        """Return arrays of the probabilities of roots and suffixes (indexed by symbol id) and of (transition, feature)
+        pairs (in the order of `pair_trans` and `pair_feats`).
+
+        Root and suffix probabilities are divided by their totals, and transition probabilities by the total of their
+        feature (they're zero for the pairs of a feature whose candidates were all removed).
+        """
+        probstems = self.estems / self.estems.sum()
+        probsuffix = self.esuffix / self.esuffix.sum()
+        feat_counts = self.eftrans[np.array(self.pair_feats, dtype=np.int64)]
+        probtrans = np.divide(self.etrans, feat_counts, out=np.zeros(len(self.etrans)), where=feat_counts > 0)
+        return probstems, probsuffix, probtrans
+
+
+def _grow(counts, size):
+    """Pad an array of counts with zeros up to `size`."""
+    if len(counts) >= size:
+        return counts
+    return np.concatenate((counts, np.zeros(size - len(counts))))
+
+
+def _lattice_arrays(token_segs):
+    """Get NumPy views of the root, trans, suffix, and feature ids of a CandidateLattice, along with the number of
+    candidates of each token."""
+    root_ids = np.asarray(token_segs.root_ids)
+    trans_ids = np.asarray(token_segs.trans_ids)
+    suffix_ids = np.asarray(token_segs.suffix_ids)
+    feat_ids = np.asarray(token_segs.feat_ids)
+    seg_counts = np.diff(np.asarray(token_segs.offsets))
+    return root_ids, trans_ids, suffix_ids, feat_ids, seg_counts
+
+
+def _array_to_prob_dict(probs):
+    """Convert an array of probabilities indexed by symbol id into a dictionary, leaving out zeros."""
+    ids = np.flatnonzero(probs)
+    return dict(zip(ids.tolist(), probs[ids].tolist()))
+
+
+def _prob_dict_to_array(prob_dict, size):
+    """Convert a dictionary of probabilities keyed by symbol id into an array of length `size`."""
+    probs = np.zeros(size)
+    if prob_dict:
+        probs[np.fromiter(prob_dict.keys(), dtype=np.int64, count=len(prob_dict))] = list(prob_dict.values())
+    return probs
+
+
+def calc_seg_prob(ts, probroots, probsuffix, probtrans, symbols):
     """Calculate the score of a single segmentation `ts`, based on the probabilities given by the other parameters.
 
-    This is equation (3) from the paper.
+    This is equation (3) from the paper. `symbols` is the SymbolTable the probabilities are keyed by; anything missing
+    from it has never been seen in training, so the score is zero.
     """
-    root = ts.root
-    suffix = ts.suffix
-    trans = ts.trans
-    feat = feature(root, suffix)
+    root = symbols.get_id(ts.root)
+    trans = symbols.get_id(ts.trans)
+    suffix = symbols.get_id(ts.suffix)
+    feat = symbols.get_id(feature(ts.root, ts.suffix))
+    return calc_key_prob(root, trans, suffix, feat, probroots, probsuffix, probtrans)
+
+
+def calc_key_prob(root, trans, suffix, feat, probroots, probsuffix, probtrans):
+    """Calculate the score of a single (root, trans, suffix) triple with its feature, all given as symbol ids."""
     score = 0.0
     if root in probroots and suffix in probsuffix and (trans, feat) in probtrans:
         score = probroots[root] * probsuffix[suffix] * probtrans[(trans, feat)]
@@ -93,7 +190,7 @@ def calc_seg_probs(token_segs, probroots, probsuffix, probtrans):
         seg_probs = []
         token = segs[0].token
         for ts in segs:
-            score = calc_seg_prob(ts, probroots, probsuffix, probtrans)
+            score = calc_seg_prob(ts, probroots, probsuffix, probtrans, token_segs.symbols)
             seg_probs.append((ts, score))
         seg_probs = sorted(seg_probs, key=lambda x: -x[1])
         token_seg_probs.append((token, seg_probs))
@@ -101,18 +198,113 @@ def calc_seg_probs(token_segs, probroots, probsuffix, probtrans):
 
 
 def do_step1_segmention(token_segs, probroots, probsuffix, probtrans):
-    """Find the most likely token segmentation among those listed for each token."""
-    resolved_segs = []
-    for segs in token_segs:
-        max_score = -1.0
-        best_ts = None
-        for ts in segs:
-            score = calc_seg_prob(ts, probroots, probsuffix, probtrans)
-            if score > max_score:
-                best_ts = ts
-                max_score = score
-        resolved_segs.append(best_ts)
-    return resolved_segs
+    """Find the most likely token segmentation among those listed for each token in `token_segs` (a CandidateLattice).
+
+    Return a CandidateLattice holding just the best segmentation of each token.
+    """
+    best_indices = _find_step1_segmentations(token_segs, probroots, probsuffix, probtrans)
+    return token_segs.select(best_indices.tolist())
+
+
+def _find_step1_segmentations(token_segs, probroots, probsuffix, probtrans):
+    """Convert the probability dictionaries to arrays, and return the result of find_best_segmentations."""
+    num_symbols = len(token_segs.symbols)
+    root_probs = _prob_dict_to_array(probroots, num_symbols)
+    suffix_probs = _prob_dict_to_array(probsuffix, num_symbols)
+    # transitions are looked up by their encoded (trans id, feature id) pair
+    trans_codes = np.array([trans * PAIR_BASE + ftrans for trans, ftrans in probtrans], dtype=np.int64)
+    trans_probs = np.array(list(probtrans.values()))
+    order = np.argsort(trans_codes)
+    trans_codes, trans_probs = trans_codes[order], trans_probs[order]
+    return find_best_segmentations(token_segs, root_probs, suffix_probs, trans_codes, trans_probs)
+
+
+def find_best_segmentations(token_segs, root_probs, suffix_probs, trans_codes, trans_probs):
+    """Return the index of the most likely candidate of each token in `token_segs` (a CandidateLattice).
+
+    Root and suffix probabilities are arrays indexed by symbol id. Transition probabilities are given for the sorted
+    array of encoded (trans id, feature id) pairs in `trans_codes`. Scores are the same products as those of
+    calc_seg_prob, multiplied in the same order, so a candidate with an unknown root, suffix, or transition scores
+    zero, and the candidate chosen is the one do_step1_segmention always chose: the first with the highest score.
+    """
+    root_ids, trans_ids, suffix_ids, feat_ids, seg_counts = _lattice_arrays(token_segs)
+    if not len(seg_counts):
+        return np.zeros(0, dtype=np.int64)
+
+    # gather the transition probability of each candidate
+    cand_codes = trans_ids.astype(np.int64) * PAIR_BASE + feat_ids
+    positions = np.minimum(np.searchsorted(trans_codes, cand_codes), max(0, len(trans_codes) - 1))
+    cand_trans_probs = np.zeros(len(cand_codes))
+    if len(trans_codes):
+        found = trans_codes[positions] == cand_codes
+        cand_trans_probs[found] = trans_probs[positions[found]]
+
+    scores = root_probs[root_ids] * suffix_probs[suffix_ids] * cand_trans_probs
+    return _segmented_argmax(scores, np.asarray(token_segs.offsets)[:-1], seg_counts)
+
+
+def _segmented_argmax(scores, starts, seg_counts):
+    """Return the index of the first candidate of each token reaching the token's maximum score."""
+    max_scores = np.maximum.reduceat(scores, starts)
+    is_max = scores == np.repeat(max_scores, seg_counts)
+    candidate_indices = np.where(is_max, np.arange(len(scores)), len(scores))
+    return np.minimum.reduceat(candidate_indices, starts)
+
+
+def do_em_segmentation(token_segs, probroots, probsuffix, probtrans, max_iterations, min_change=0.0):
+    """Like do_step1_segmention, but then re-estimate the model with hard EM.
+
+    Each iteration estimates the probabilities of roots, suffixes, and transitions from the current best segmentation
+    of each token, and segments the tokens again. The counts are only updated for the tokens whose segmentation
+    changed. This stops after `max_iterations` iterations, or once the fraction of tokens that changed is no more than
+    `min_change`. Return the CandidateLattice of best segmentations, and the number of tokens that changed at each
+    iteration.
+    """
+    best_indices = _find_step1_segmentations(token_segs, probroots, probsuffix, probtrans)
+    root_ids, trans_ids, suffix_ids, feat_ids, seg_counts = _lattice_arrays(token_segs)
+    num_tokens = len(seg_counts)
+    if not num_tokens:
+        return token_segs.select([]), []
+    starts = np.asarray(token_segs.offsets)[:-1]
+    num_symbols = len(token_segs.symbols)
+    # index the (transition, feature) pair of each candidate
+    pair_codes, cand_pairs = np.unique(trans_ids.astype(np.int64) * PAIR_BASE + feat_ids, return_inverse=True)
+    cand_pairs = cand_pairs.ravel()
+    pair_feats = pair_codes % PAIR_BASE
+
+    # count the best segmentations
+    root_counts = np.bincount(root_ids[best_indices], minlength=num_symbols).astype(float)
+    suffix_counts = np.bincount(suffix_ids[best_indices], minlength=num_symbols).astype(float)
+    feat_counts = np.bincount(feat_ids[best_indices], minlength=num_symbols).astype(float)
+    pair_counts = np.bincount(cand_pairs[best_indices], minlength=len(pair_codes)).astype(float)
+
+    changes = []
+    for itr in range(max_iterations):
+        # M step: every token contributes one root, one suffix, and one transition
+        root_probs = root_counts / num_tokens
+        suffix_probs = suffix_counts / num_tokens
+        pair_feat_counts = feat_counts[pair_feats]
+        pair_probs = np.divide(pair_counts, pair_feat_counts, out=np.zeros(len(pair_counts)),
+                               where=pair_feat_counts > 0)
+
+        # E step: resegment every token
+        scores = root_probs[root_ids] * suffix_probs[suffix_ids] * pair_probs[cand_pairs]
+        new_best_indices = _segmented_argmax(scores, starts, seg_counts)
+
+        # update the counts of the tokens that changed
+        changed = np.flatnonzero(new_best_indices != best_indices)
+        old, new = best_indices[changed], new_best_indices[changed]
+        for counts, ids in ((root_counts, root_ids), (suffix_counts, suffix_ids), (feat_counts, feat_ids),
+                            (pair_counts, cand_pairs)):
+            np.subtract.at(counts, ids[old], 1)
+            np.add.at(counts, ids[new], 1)
+        best_indices = new_best_indices
+
+        changes.append(len(changed))
+        print('--EM iteration %s: %s of %s segmentations changed' % (itr + 1, len(changed), num_tokens))
+        if len(changed) <= min_change * num_tokens:
+            break
+    return token_segs.select(best_indices.tolist()), changes
 
 
 def estimate_suffix_probability(suffix_freq_dict):
@@ -0,0 +1,64 @@
+'''Timing of the stages of training and segmentation on a word frequency list. Created on Oct 17, 2026.
+'''
+
+
+import argparse
+import os
+import tempfile
+import time
+from param import Parameter
+from morphanalyzer import MorphAnalyzer
+from wordlists import read_word_freq_list
+
+
+def bench_model_io(word_freq_list, params):
+    """Compare the time to train a model with the time to save it and load it back, in both model formats.
+
+    Returns a dictionary of the times in seconds, along with the sizes of the saved models in bytes.
+    """
+    results = {}
+    start = time.perf_counter()
+    morph_analyzer = MorphAnalyzer(params)
+    morph_analyzer.train(word_freq_list)
+    results['train'] = time.perf_counter() - start
+
+    fd, modelfile = tempfile.mkstemp(suffix='.model')
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        morph_analyzer.save(modelfile)
+        results['save'] = time.perf_counter() - start
+        results['model_bytes'] = os.path.getsize(modelfile)
+
+        start = time.perf_counter()
+        MorphAnalyzer.load(modelfile)
+        results['load'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        morph_analyzer.save(modelfile, mapped=True)
+        results['save_mapped'] = time.perf_counter() - start
+        results['mapped_model_bytes'] = os.path.getsize(modelfile)
+
+        start = time.perf_counter()
+        MorphAnalyzer.load(modelfile)
+        results['load_mapped'] = time.perf_counter() - start
+    finally:
+        os.remove(modelfile)
+    return results
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('infile', help='The input file containing a word list with line format: <word> <freq>')
+    args = arg_parser.parse_args()
+    parameters = Parameter()
+    times = bench_model_io(read_word_freq_list(args.infile), parameters)
+    print('--------------Benchmark--------------')
+    print('Train: %.3fs' % times['train'])
+    print('Save: %.3fs' % times['save'])
+    print('Load: %.3fs (%.1fx faster than training)' % (times['load'], times['train'] / times['load']))
+    print('Model size: %s bytes' % times['model_bytes'])
+    print('Save (mapped): %.3fs' % times['save_mapped'])
+    print('Load (mapped): %.3fs (%.1fx faster than training)' % (times['load_mapped'],
+                                                               times['train'] / times['load_mapped']))
+    print('Model size (mapped): %s bytes' % times['mapped_model_bytes'])
@@ -0,0 +1,148 @@
+'''Caches of segmentations for tokens that aren't in the segmentation dictionary. Created on Oct 17, 2026.
+'''
+
+
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class LRUCache():
+    """A bounded cache that evicts the least recently used entry when full, and counts hits, misses, and evictions.
+
+    A cache with a `max_size` of 0 or less stores nothing.
+    """
+
+    def __init__(self, max_size):
+        """Create an empty cache holding at most `max_size` entries."""
+        self.max_size = max_size
+        self.entries = OrderedDict()  # ordered from least to most recently used
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the value of the key, marking it as recently used, or `default` if it isn't cached."""
+        entries = self.entries
+        if key in entries:
+            entries.move_to_end(key)
+            self.hits += 1
+            return entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """Cache the value of the key, evicting the least recently used entry if the cache is full."""
+        if self.max_size <= 0:
+            return
+        entries = self.entries
+        entries[key] = value
+        entries.move_to_end(key)
+        if len(entries) > self.max_size:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Remove all entries and reset the counters."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a dictionary of the hit, miss, and eviction counts, along with the current and maximum sizes."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries),
+                'max_size': self.max_size}
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class PersistentSegCache():
+    """A segmentation cache kept in an SQLite file, so that it's shared across runs.
+
+    Entries are keyed by the fingerprint of the model that produced them and the token, so the entries of several
+    models can share a file. The file also keeps the time each model last opened it, and opening it removes the entries
+    of the models that haven't opened it for `max_age` days, so those of replaced models expire on their own; prune
+    removes those of all other models at once. Lookups and inserts are done in bulk for a batch of tokens.
+    """
+
+    QUERY_SIZE = 500  # the number of tokens looked up by a single query, well under SQLite's limit on parameters
+
+    def __init__(self, path, fingerprint, max_age=0):
+        """Open (or create) the cache file at `path` for the model with the given fingerprint, removing the entries of
+        the models that haven't opened it for `max_age` days (if it's greater than 0)."""
+        self.fingerprint = fingerprint
+        self.connection = sqlite3.connect(path)
+        now = time.time()
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS segmentations (fingerprint TEXT NOT NULL, token TEXT NOT NULL, '
+                'segmentation TEXT NOT NULL, PRIMARY KEY (fingerprint, token)) WITHOUT ROWID')
+            if not self.connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'models'").fetchone():
+                self.connection.execute(
+                    'CREATE TABLE models (fingerprint TEXT PRIMARY KEY, last_used REAL NOT NULL) WITHOUT ROWID')
+                # the models of a file made before last use times were kept are taken to be used now
+                self.connection.execute('INSERT INTO models SELECT DISTINCT fingerprint, ? FROM segmentations', (now,))
+            self.connection.execute('INSERT OR REPLACE INTO models (fingerprint, last_used) VALUES (?, ?)',
+                                    (fingerprint, now))
+            if max_age > 0:
+                self.__remove_models(self.connection.execute(
+                    'SELECT fingerprint FROM models WHERE last_used < ?', (now - max_age * SECONDS_PER_DAY,)))
+
+    def get_many(self, tokens):
+        """Return a dictionary of the cached segmentations of those of the tokens that are cached."""
+        tokens = list(tokens)
+        found = {}
+        for start in range(0, len(tokens), self.QUERY_SIZE):
+            chunk = tokens[start:start + self.QUERY_SIZE]
+            query = 'SELECT token, segmentation FROM segmentations WHERE fingerprint = ? AND token IN (%s)' % (
+                ','.join('?' * len(chunk)))
+            for token, segmentation in self.connection.execute(query, [self.fingerprint] + chunk):
+                morphs, components = json.loads(segmentation)
+                found[token] = (tuple(morphs), tuple(tuple(component) for component in components))
+        return found
+
+    def put_many(self, token_segs):
+        """Cache the segmentations in an iterable of (token, segmentation) pairs, in a single transaction."""
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO segmentations (fingerprint, token, segmentation) VALUES (?, ?, ?)',
+                ((self.fingerprint, token, json.dumps(seg, ensure_ascii=False)) for token, seg in token_segs))
+
+    def __remove_models(self, fingerprints):
+        """Remove the models with the given fingerprints and their entries, returning how many entries were removed."""
+        num_removed = 0
+        for (fingerprint,) in list(fingerprints):
+            num_removed += self.connection.execute('DELETE FROM segmentations WHERE fingerprint = ?',
+                                                   (fingerprint,)).rowcount
+            self.connection.execute('DELETE FROM models WHERE fingerprint = ?', (fingerprint,))
+        return num_removed
+
+    def prune(self):
+        """Remove the entries of every model other than this one, returning how many were removed."""
+        with self.connection:
+            return self.__remove_models(self.connection.execute(
+                'SELECT fingerprint FROM models WHERE fingerprint != ?', (self.fingerprint,)))
+
+    def close(self):
+        """Close the cache file."""
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM segmentations WHERE fingerprint = ?',
+                                       (self.fingerprint,)).fetchone()[0]
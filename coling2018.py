@@ -8,24 +8,7 @@ Created on Jun 11, 2018
 from param import Parameter
 from evaluation import evaluate_seg
 from morphanalyzer import MorphAnalyzer
-
-
-def read_word_freq_list(infile):
-    """Read a file where each line contains a word and its frequency count, tab-separated.
-
-    Returns a list of tuples of the form (word, freq).
-    """
-    fin = open(infile, 'r', -1, 'utf-8')
-    wordlist = []
-    for line in fin:
-        splitline = line.strip().split()
-        if not line:
-            continue
-        word = splitline[0]
-        freq = int(splitline[1])
-        wordlist.append((word, freq))
-    fin.close()
-    return wordlist
+from wordlists import read_word_freq_list
 
 
 def read_test_gold(infile):
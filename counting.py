@@ -0,0 +1,101 @@
+'''Counting the words of raw text files into a word frequency list, in parallel. Created on Oct 17, 2026.
+'''
+
+
+import os
+import re
+from collections import Counter
+from workers import worker_pool, get_shared
+from wordlists import is_compressed, iter_blocks
+
+
+CHUNK_SIZE = 1 << 24  # the number of bytes of text counted in one task
+
+
+class Tokenizer():
+    """Splits text into words: runs of letters, possibly joined by hyphens or apostrophes and ending in an apostrophe.
+
+    Hyphens and apostrophes are kept inside words, so that MorphAnalyzer.train handles them as it does for words of a
+    frequency list (see Parameter.DoHyphen and Parameter.DoApostrophe).
+    """
+
+    def __init__(self, apostrophe_char='\'', lowercase=True):
+        """Create a tokenizer using `apostrophe_char` as the apostrophe, which lowercases words if `lowercase` is set."""
+        apostrophe = re.escape(apostrophe_char)
+        self.pattern = re.compile(r'[^\W\d_]+(?:[-%s][^\W\d_]+)*%s?' % (apostrophe, apostrophe))
+        self.lowercase = lowercase
+
+    def tokenize(self, text):
+        """Return the list of words of a text."""
+        if self.lowercase:
+            text = text.lower()
+        return self.pattern.findall(text)
+
+
+def count_chunk(path, start, end, tokenizer):
+    """Count the words of the lines of a file that start at a byte offset from `start` up to `end`, or of the whole
+    file (decompressed if it's compressed) if `end` is None.
+
+    Returns a Counter of the words.
+    """
+    if end is None:
+        counts = Counter()
+        for block in iter_blocks(path):
+            counts.update(tokenizer.tokenize(block.decode('utf-8')))
+        return counts
+    with open(path, 'rb') as fin:
+        if start:
+            # skip the rest of the line that started in the previous chunk
+            fin.seek(start - 1)
+            fin.readline()
+        data = fin.read(max(0, end - fin.tell()))
+        if data and not data.endswith(b'\n'):
+            data += fin.readline()  # finish the last line
+    return Counter(tokenizer.tokenize(data.decode('utf-8')))
+
+
+def _count_chunk(chunk):
+    """Count the words of a chunk (path, start, end) in a worker process, with the tokenizer shared by worker_pool."""
+    path, start, end = chunk
+    return count_chunk(path, start, end, get_shared())
+
+
+def split_files(paths, chunk_size=CHUNK_SIZE):
+    """Split files into chunks of about `chunk_size` bytes, returning a list of (path, start, end).
+
+    Compressed files can't be split, so each is a single chunk (path, 0, None).
+    """
+    chunks = []
+    for path in paths:
+        if is_compressed(path):
+            chunks.append((path, 0, None))
+            continue
+        size = os.path.getsize(path)
+        chunks.extend((path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size))
+    return chunks
+
+
+def count_words(paths, num_workers=1, min_freq=1, tokenizer=None, chunk_size=CHUNK_SIZE):
+    """Count the words of raw UTF-8 text files (see Tokenizer), which may be compressed with gzip, bzip2, or xz, in
+    chunks of `chunk_size` bytes.
+
+    If `num_workers` is greater than 1, the chunks are counted in that many worker processes, and their counts merged.
+    Words occurring fewer than `min_freq` times in all are left out once the counts are merged.
+
+    Returns a list of tuples of the form (word, freq), from the most to the least frequent word (then alphabetically),
+    as given to MorphAnalyzer.train.
+    """
+    if tokenizer is None:
+        tokenizer = Tokenizer()
+    chunks = split_files(paths, chunk_size)
+    counts = Counter()
+    if num_workers > 1:
+        with worker_pool(tokenizer, num_workers) as pool:
+            for chunk_counts in pool.imap_unordered(_count_chunk, chunks):
+                counts.update(chunk_counts)
+    else:
+        for path, start, end in chunks:
+            counts.update(count_chunk(path, start, end, tokenizer))
+    word_freq_list = [(word, freq) for word, freq in counts.items() if freq >= min_freq]
+    word_freq_list.sort(key=lambda word_freq: (-word_freq[1], word_freq[0]))
+    return word_freq_list
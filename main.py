@@ -6,58 +6,220 @@
 
 
 import argparse
+import sys
+import time
+from tqdm import tqdm
 from param import Parameter
 from morphanalyzer import MorphAnalyzer
+from counting import count_words, Tokenizer
+from wordlists import read_word_freq_list, iter_word_list, read_word_list
+from segfile import SegmentationWriter, write_segmentations
+from caches import PersistentSegCache
 
 
-def read_word_freq_list(infile):
-    """Read a file where each line contains a word and its frequency count, tab-separated.
+OUTPUT_BUFFER_SIZE = 1 << 20  # the number of bytes of streamed segmentations buffered before each write
+OUTPUT_FORMATS = ('tsv', 'binary')  # tab-separated text, or the columnar format of segfile
 
-    Returns a list of tuples of the form (word, freq).
+
+def read_training_data(infile, params, tokenizer=None, min_freq=1):
+    """Read the word frequency list to train on from `infile`.
+
+    If `tokenizer` is given, `infile` is raw text, whose words are counted with it in params.NumWorkers processes, and
+    words occurring fewer than `min_freq` times are left out (see counting.count_words).
     """
-    fin = open(infile, 'r', -1, 'utf-8')
-    wordlist = []
-    for line in fin:
-        splitline = line.strip().split()
-        if not line:
-            continue
-        word = splitline[0]
-        freq = int(splitline[1])
-        wordlist.append((word, freq))
-    fin.close()
-    return wordlist
-
-
-def save_segmentations(word_segs, outfile):
-    """Write segmentations to a file."""
+    if tokenizer is None:
+        return read_word_freq_list(infile)
+    return count_words([infile], params.NumWorkers, min_freq, tokenizer)
+
+
+def save_word_freq_list(word_freq_list, outfile):
+    """Write a word frequency list to a file, a word and its frequency tab-separated on each line."""
+    with open(outfile, 'w', OUTPUT_BUFFER_SIZE, 'utf-8') as fout:
+        for word, freq in word_freq_list:
+            fout.write('%s\t%s\n' % (word, freq))
+
+
+def format_segmentation(word, word_seg):
+    """Format the segmentation of a word as a line of the output file."""
+    seg, components = word_seg
+    seg_str = ' '.join(seg)
+    component_str = ' '.join([' '.join(component) for component in components])
+    return '%s\t%s\t%s\n' % (word, seg_str, component_str)
+
+
+def save_segmentations(word_segs, outfile, output_format='tsv'):
+    """Write segmentations to a file, in one of OUTPUT_FORMATS."""
+    if output_format == 'binary':
+        write_segmentations(word_segs, outfile)
+        return
     fout = open(outfile, 'w', -1, 'utf-8')
-    for word, (seg, components) in word_segs:
-        seg_str = ' '.join(seg)
-        component_str = ' '.join([' '.join(component) for component in components])
-        fout.write('%s\t%s\t%s\n' % (word, seg_str, component_str))
+    for word, word_seg in word_segs:
+        fout.write(format_segmentation(word, word_seg))
     fout.close()
 
 
-def run(infile, outfile, params):
-    """Run morphological segmentation on frequency data in `infile`, and save results in `outfile`."""
+def stream_segmentations(morph_analyzer, words, outfile, batch_size=None, num_workers=1, output_format='tsv'):
+    """Segment the words of an iterable a batch at a time, writing each batch to `outfile` (in one of OUTPUT_FORMATS)
+    as soon as it's segmented.
+
+    Only one batch of words and segmentations is held in memory at once (see MorphAnalyzer.segment_token_batches), so
+    memory use stays flat however many words there are. Progress and throughput are reported along the way. Returns the
+    number of words segmented.
+    """
+    if output_format == 'binary':
+        writer = SegmentationWriter(outfile)
+        write_batch = writer.write
+    else:
+        writer = open(outfile, 'w', OUTPUT_BUFFER_SIZE, 'utf-8')
+
+        def write_batch(batch, batch_segs):
+            writer.writelines(map(format_segmentation, batch, batch_segs))
+
+    num_words = 0
+    start = time.perf_counter()
+    with writer, tqdm(unit=' words', unit_scale=True) as progress:
+        for batch, batch_segs in morph_analyzer.segment_token_batches(words, batch_size, num_workers):
+            write_batch(batch, batch_segs)
+            num_words += len(batch)
+            progress.update(len(batch))
+    elapsed = time.perf_counter() - start
+    print('| Segmented %s words in %.1fs (%.0f words/s)' % (num_words, elapsed, num_words / max(elapsed, 1e-9)))
+    return num_words
+
+
+def format_morph_text(token_segs, separator):
+    """Format a line of text with each token replaced by its morphs, joined by `separator`."""
+    return ' '.join(separator.join(seg) for seg, _components in token_segs) + '\n'
+
+
+def run(infile, outfile, params, stream=False, tokenizer=None, min_freq=1, output_format='tsv'):
+    """Run morphological segmentation on frequency data in `infile`, and save results in `outfile` (in one of
+    OUTPUT_FORMATS).
+
+    If `stream` is set, the words are segmented and saved a batch of params.SegmentBatchSize words at a time after
+    training (see stream_segmentations), reading them from `infile` again. If `tokenizer` is given, `infile` is raw text
+    (see read_training_data).
+    """
     print('| Reading data...')
-    word_freq_list = read_word_freq_list(infile)
+    word_freq_list = read_training_data(infile, params, tokenizer, min_freq)
     print('| Analyzing...')
     morph_analyzer = MorphAnalyzer(params)
     morph_analyzer.train(word_freq_list)
+    if stream:
+        if tokenizer is None:
+            del word_freq_list
+            words = iter_word_list(infile)
+        else:
+            words = (word for word, _freq in word_freq_list)
+        print('| Segmenting and saving result...')
+        stream_segmentations(morph_analyzer, words, outfile, params.SegmentBatchSize, params.NumWorkers, output_format)
+        print('| Done!')
+        return
     print('| Segmenting...')
     word_list = [word for word, _freq in word_freq_list]
-    word_segs = morph_analyzer.segment_token_list(word_list)
+    word_segs = morph_analyzer.segment_token_list(word_list, params.NumWorkers)
     print('| Saving result...')
-    save_segmentations(zip(word_list, word_segs), outfile)
+    save_segmentations(zip(word_list, word_segs), outfile, output_format)
     print('| Done!')
 
 
-if __name__ == '__main__':
-    parameters = Parameter()
-    arg_parser = argparse.ArgumentParser()
-    arg_parser.add_argument('infile', help='The input file containing a word list with line format: <word> <freq>')
-    arg_parser.add_argument('outfile', help='The output file to save the segmentation result')
+def train(infile, modelfile, params, mapped=False, tokenizer=None, min_freq=1):
+    """Train a model on frequency data in `infile`, and save it in `modelfile` (in the memory-mapped format if `mapped`
+    is set). If `tokenizer` is given, `infile` is raw text (see read_training_data)."""
+    print('| Reading data...')
+    word_freq_list = read_training_data(infile, params, tokenizer, min_freq)
+    print('| Analyzing...')
+    morph_analyzer = MorphAnalyzer(params)
+    morph_analyzer.train(word_freq_list)
+    print('| Saving model...')
+    morph_analyzer.save(modelfile, mapped)
+    print('| Done!')
+
+
+def set_cache(morph_analyzer, cachefile, cache_clear=False, cache_max_age=None):
+    """Cache the segmentations of unknown words of `morph_analyzer` in `cachefile` across runs, if it's given.
+
+    If `cache_clear` is set, the segmentations cached there by other models are removed first. If `cache_max_age` is
+    given, it replaces Parameter.OOVCacheMaxAge.
+    """
+    morph_analyzer.param.OOVCachePath = cachefile
+    if cache_max_age is not None:
+        morph_analyzer.param.OOVCacheMaxAge = cache_max_age
+    if cachefile and cache_clear:
+        with PersistentSegCache(cachefile, morph_analyzer.fingerprint(), morph_analyzer.param.OOVCacheMaxAge) as cache:
+            print('| Removed %s cached segmentations of other models' % cache.prune())
+
+
+def segment(modelfile, infile, outfile, cachefile=None, num_workers=1, stream=False, batch_size=None,
+            output_format='tsv', cache_clear=False, cache_max_age=None):
+    """Segment the words in `infile` with the model saved in `modelfile`, and save results in `outfile` (in one of
+    OUTPUT_FORMATS).
+
+    If `cachefile` is given, segmentations of unknown words are cached there across runs (see set_cache for
+    `cache_clear` and `cache_max_age`). If `num_workers` is greater than 1, the words are segmented in that many worker
+    processes. If `stream` is set, the words are read, segmented, and saved a batch of `batch_size` words at a time
+    (see stream_segmentations).
+    """
+    print('| Loading model...')
+    morph_analyzer = MorphAnalyzer.load(modelfile)
+    set_cache(morph_analyzer, cachefile, cache_clear, cache_max_age)
+    if stream:
+        print('| Segmenting and saving result...')
+        stream_segmentations(morph_analyzer, iter_word_list(infile), outfile, batch_size, num_workers, output_format)
+        print('| Done!')
+        return
+    print('| Reading data...')
+    word_list = read_word_list(infile)
+    print('| Segmenting...')
+    word_segs = morph_analyzer.segment_token_list(word_list, num_workers)
+    print('| Saving result...')
+    save_segmentations(zip(word_list, word_segs), outfile, output_format)
+    print('| Done!')
+
+
+def segment_text(modelfile, infile, outfile, text=False, separator='+', cachefile=None, num_workers=1,
+                 batch_size=None, cache_clear=False, cache_max_age=None):
+    """Segment the tokenized text in `infile` (whitespace-separated tokens) with the model saved in `modelfile`, and
+    save results in `outfile`.
+
+    The text is read, segmented, and saved a batch of `batch_size` tokens at a time, and each distinct type of a batch
+    is segmented once (see MorphAnalyzer.segment_corpus). The output has a line for each token, in the format of
+    save_segmentations, and an empty line after each line of text; if `text` is set, it's the text itself, with each
+    token replaced by its morphs joined by `separator`. `cachefile`, `cache_clear`, `cache_max_age`, and `num_workers`
+    are as in segment.
+    """
+    print('| Loading model...')
+    morph_analyzer = MorphAnalyzer.load(modelfile)
+    set_cache(morph_analyzer, cachefile, cache_clear, cache_max_age)
+    print('| Segmenting and saving result...')
+    num_tokens = 0
+    start = time.perf_counter()
+    with open(infile, 'r', -1, 'utf-8') as fin, open(outfile, 'w', OUTPUT_BUFFER_SIZE, 'utf-8') as fout, \
+            tqdm(unit=' tokens', unit_scale=True) as progress:
+        for tokens, token_segs in morph_analyzer.segment_corpus(fin, batch_size, num_workers):
+            if text:
+                fout.write(format_morph_text(token_segs, separator))
+            else:
+                fout.writelines(map(format_segmentation, tokens, token_segs))
+                fout.write('\n')
+            num_tokens += len(tokens)
+            progress.update(len(tokens))
+    elapsed = time.perf_counter() - start
+    print('| Segmented %s tokens in %.1fs (%.0f tokens/s)' % (num_tokens, elapsed, num_tokens / max(elapsed, 1e-9)))
+    print('| Done!')
+
+
+def count(infiles, outfile, num_workers=1, min_freq=1, tokenizer=None):
+    """Count the words of the raw text files `infiles`, and save the word frequency list in `outfile`."""
+    print('| Counting...')
+    word_freq_list = count_words(infiles, num_workers, min_freq, tokenizer)
+    print('| Saving result...')
+    save_word_freq_list(word_freq_list, outfile)
+    print('| Done!')
+
+
+def add_param_arguments(arg_parser, parameters):
+    """Add the options that set training parameters to `arg_parser`."""
     arg_parser.add_argument(
         '-p', '--prune', help='Whether use pruning (1|0, default:%s)' % parameters.DoPruning, type=bool,
         default=parameters.DoPruning)
@@ -83,7 +245,57 @@ if __name__ == '__main__':
     arg_parser.add_argument(
         '-s', '--suff', help='Maximal length of suffixes (default:%s)' % parameters.MaxSuffixLen, type=int,
         default=parameters.MaxSuffixLen)
-    args = arg_parser.parse_args()
+    arg_parser.add_argument(
+        '-w', '--workers',
+        help='Number of worker processes used in training and segmentation (default:%s)' % parameters.NumWorkers,
+        type=int,
+        default=parameters.NumWorkers)
+
+
+def add_stream_arguments(arg_parser, parameters):
+    """Add the options that stream segmentations to `arg_parser`."""
+    arg_parser.add_argument(
+        '--stream', help='Read, segment, and save the words a batch at a time, in constant memory', action='store_true')
+    arg_parser.add_argument(
+        '--batch', help='Number of words per batch with --stream (default:%s)' % parameters.SegmentBatchSize, type=int,
+        default=parameters.SegmentBatchSize)
+
+
+def add_output_arguments(arg_parser):
+    """Add the options that choose the format of segmentation results to `arg_parser`."""
+    arg_parser.add_argument(
+        '-f', '--format', help='The format of the output file (default:tsv; binary is the columnar format of segfile)',
+        choices=OUTPUT_FORMATS, default='tsv')
+
+
+def add_cache_arguments(arg_parser, parameters):
+    """Add the options of the persistent cache of segmentations of unknown words to `arg_parser`."""
+    arg_parser.add_argument(
+        '--cache', help='An SQLite file caching the segmentations of unknown words across runs of the same model')
+    arg_parser.add_argument(
+        '--cache-clear', help='Remove the segmentations cached by other models from the --cache file first',
+        action='store_true')
+    arg_parser.add_argument(
+        '--cache-max-age', help='Remove the segmentations cached by models that haven\'t used the --cache file for '
+        'this many days; 0 keeps them (default:%s)' % parameters.OOVCacheMaxAge, type=float,
+        default=parameters.OOVCacheMaxAge)
+
+
+def add_count_arguments(arg_parser):
+    """Add the options that control how raw text is counted to `arg_parser`."""
+    arg_parser.add_argument(
+        '--min-freq', help='Leave out words occurring fewer times than this in raw text (default:1)', type=int,
+        default=1)
+    arg_parser.add_argument('--keep-case', help='Don\'t lowercase the words of raw text', action='store_true')
+
+
+def get_tokenizer(args, parameters):
+    """Return the Tokenizer of raw text set by the options of add_count_arguments."""
+    return Tokenizer(parameters.ApostropheChar, not args.keep_case)
+
+
+def set_param_arguments(args, parameters):
+    """Copy the options added by add_param_arguments from `args` to `parameters`."""
     parameters.DoPruning = args.prune
     parameters.UseTransRules = args.trans
     parameters.DoCompound = args.comp
@@ -92,5 +304,83 @@ if __name__ == '__main__':
     parameters.DoApostrophe = args.apos
     parameters.MinStemLen = args.root
     parameters.MaxSuffixLen = args.suff
-    parameters.print_all()
-    run(args.infile, args.outfile, parameters)
+    parameters.NumWorkers = args.workers
+
+
+COMMANDS = ('run', 'train', 'segment', 'corpus', 'count')
+
+
+if __name__ == '__main__':
+    parameters = Parameter()
+    arg_parser = argparse.ArgumentParser(
+        description='Train and/or segment. Without a command, "run" is assumed (train, then segment the same file).')
+    subparsers = arg_parser.add_subparsers(dest='command')
+    run_parser = subparsers.add_parser('run', help='Train on a word list and segment it')
+    run_parser.add_argument('infile', help='The input file containing a word list with line format: <word> <freq>')
+    run_parser.add_argument('outfile', help='The output file to save the segmentation result')
+    add_param_arguments(run_parser, parameters)
+    add_stream_arguments(run_parser, parameters)
+    add_output_arguments(run_parser)
+    run_parser.add_argument('--raw', help='The input file is raw text, whose words are counted', action='store_true')
+    add_count_arguments(run_parser)
+    train_parser = subparsers.add_parser('train', help='Train on a word list and save the model')
+    train_parser.add_argument('infile', help='The input file containing a word list with line format: <word> <freq>')
+    train_parser.add_argument('modelfile', help='The output file to save the model')
+    train_parser.add_argument(
+        '-m', '--mapped', help='Save the model in the read-only format that is memory-mapped when loaded',
+        action='store_true')
+    add_param_arguments(train_parser, parameters)
+    train_parser.add_argument('--raw', help='The input file is raw text, whose words are counted', action='store_true')
+    add_count_arguments(train_parser)
+    segment_parser = subparsers.add_parser('segment', help='Segment a word list with a saved model')
+    segment_parser.add_argument('modelfile', help='The model file saved by the train command')
+    segment_parser.add_argument('infile', help='The input file containing a word list with line format: <word> [freq]')
+    segment_parser.add_argument('outfile', help='The output file to save the segmentation result')
+    add_cache_arguments(segment_parser, parameters)
+    segment_parser.add_argument(
+        '-w', '--workers', help='Number of worker processes used in segmentation (default:1)', type=int, default=1)
+    add_stream_arguments(segment_parser, parameters)
+    add_output_arguments(segment_parser)
+    corpus_parser = subparsers.add_parser('corpus', help='Segment tokenized running text with a saved model')
+    corpus_parser.add_argument('modelfile', help='The model file saved by the train command')
+    corpus_parser.add_argument('infile', help='The input file containing text with whitespace-separated tokens')
+    corpus_parser.add_argument('outfile', help='The output file to save the segmentation result')
+    corpus_parser.add_argument(
+        '--text', help='Save the text with each token split into morphs, instead of a line per token',
+        action='store_true')
+    corpus_parser.add_argument('--sep', help='The separator of morphs with --text (default:+)', default='+')
+    add_cache_arguments(corpus_parser, parameters)
+    corpus_parser.add_argument(
+        '-w', '--workers', help='Number of worker processes used in segmentation (default:1)', type=int, default=1)
+    corpus_parser.add_argument(
+        '--batch', help='Number of tokens per batch (default:%s)' % parameters.SegmentBatchSize, type=int,
+        default=parameters.SegmentBatchSize)
+    count_parser = subparsers.add_parser('count', help='Count the words of raw text files into a word list')
+    count_parser.add_argument('infiles', help='The input files containing raw text', nargs='+')
+    count_parser.add_argument('outfile', help='The output file to save the word list with line format: <word> <freq>')
+    count_parser.add_argument(
+        '-w', '--workers', help='Number of worker processes used in counting (default:1)', type=int, default=1)
+    add_count_arguments(count_parser)
+    argv = sys.argv[1:]
+    if argv and argv[0] not in COMMANDS and argv[0] not in ('-h', '--help'):
+        argv = ['run'] + argv  # the original usage: main.py infile outfile
+    args = arg_parser.parse_args(argv)
+    if args.command == 'segment':
+        segment(args.modelfile, args.infile, args.outfile, args.cache, args.workers, args.stream, args.batch,
+                args.format, args.cache_clear, args.cache_max_age)
+    elif args.command == 'corpus':
+        segment_text(args.modelfile, args.infile, args.outfile, args.text, args.sep, args.cache, args.workers,
+                     args.batch, args.cache_clear, args.cache_max_age)
+    elif args.command == 'count':
+        count(args.infiles, args.outfile, args.workers, args.min_freq, get_tokenizer(args, parameters))
+    elif args.command in ('run', 'train'):
+        set_param_arguments(args, parameters)
+        parameters.print_all()
+        tokenizer = get_tokenizer(args, parameters) if args.raw else None
+        if args.command == 'run':
+            parameters.SegmentBatchSize = args.batch
+            run(args.infile, args.outfile, parameters, args.stream, tokenizer, args.min_freq, args.format)
+        else:
+            train(args.infile, args.modelfile, parameters, args.mapped, tokenizer, args.min_freq)
+    else:
+        arg_parser.print_help()
@@ -0,0 +1,393 @@
+'''A read-only model format that is memory-mapped and used in place, without loading its dictionaries. Created on
+Oct 17, 2026.
+'''
+
+
+import bisect
+import json
+import mmap
+import struct
+import sys
+import zlib
+from array import array
+from collections.abc import Mapping
+from bayesian import PAIR_BASE
+
+
+MAPPED_MAGIC = b'PARAMA\x00R'
+MAPPED_VERSION = 1
+
+# Layout (all integers little-endian):
+#   magic (8 bytes), version (uint32), number of sections (uint32), then the (offset, length) of each section as a pair
+#   of uint64, then the sections themselves, each starting at a multiple of 8 bytes.
+# Strings are kept in string pools: an int64 array of offsets (one more than the number of strings) into a section of
+# concatenated UTF-8 bytes. A key table is a string pool sorted by bytes, followed by an open-addressing hash index (an
+# int32 array whose size is a power of two, holding key indices or -1, probed linearly from the CRC-32 of the key). The
+# values of key `i` are at index `i` of the arrays that follow the table. Other sorted keys are found by binary search.
+_PARAMS = 0
+_SYMBOL_KEYS, _SYMBOL_KEY_IDS, _SYMBOL_POSITIONS = 1, 4, 5  # key tables take three sections
+_POOL_OFFSETS, _POOL_BYTES = 6, 7
+_WORD_KEYS, _WORD_FREQS = 8, 11
+_SEG_KEYS, _SEG_MORPH_OFFSETS, _SEG_MORPHS, _SEG_COMPONENT_OFFSETS, _SEG_COMPONENTS = 12, 15, 16, 17, 18
+_MORPH_KEYS, _MORPH_ROOT_OFFSETS, _MORPH_ROOTS = 19, 22, 23
+_SUFFIX_IDS, _SUFFIX_SCORES = 24, 25
+_ROOT_PROB_IDS, _ROOT_PROBS = 26, 27
+_SUFFIX_PROB_IDS, _SUFFIX_PROBS = 28, 29
+_TRANS_PROB_KEYS, _TRANS_PROBS = 30, 31
+_NUM_SECTIONS = 32
+
+
+def _symbol_key(symbol):
+    """Encode a symbol (a string, or a feature, which is a pair of strings) as the bytes of its key."""
+    if isinstance(symbol, tuple):
+        return b'\x00' + b'\x00'.join(part.encode('utf-8') for part in symbol)
+    return symbol.encode('utf-8')
+
+
+def _key_symbol(key):
+    """Decode the bytes of a key made by _symbol_key."""
+    if key.startswith(b'\x00'):
+        return tuple(part.decode('utf-8') for part in key[1:].split(b'\x00'))
+    return key.decode('utf-8')
+
+
+def _pool_sections(keys):
+    """Return the offset and byte sections of a string pool of encoded keys."""
+    offsets = array('q', [0])
+    for key in keys:
+        offsets.append(offsets[-1] + len(key))
+    return offsets.tobytes(), b''.join(keys)
+
+
+def _key_table_order(keys):
+    """Return the order in which encoded keys are stored in a key table."""
+    return sorted(range(len(keys)), key=keys.__getitem__)
+
+
+def _key_table_sections(sections, first, keys):
+    """Fill in the three sections of a key table, starting at `first`, with encoded keys in key table order."""
+    sections[first], sections[first + 1] = _pool_sections(keys)
+    num_slots = 1
+    while num_slots < 2 * len(keys):
+        num_slots *= 2
+    mask = num_slots - 1
+    slots = array('i', [-1]) * num_slots
+    for i, key in enumerate(keys):
+        slot = zlib.crc32(key) & mask
+        while slots[slot] >= 0:
+            slot = (slot + 1) & mask
+        slots[slot] = i
+    sections[first + 2] = slots.tobytes()
+
+
+def save_mapped_model(path, model):
+    """Write a model to `path` in the mapped format.
+
+    `model` has the keys of modelio.save_model, and also `morph_dict` (the morph dictionary of the TokenAnalyzer).
+    """
+    if sys.byteorder != 'little':
+        raise ValueError('Mapped models can only be written on little-endian machines')
+    sections = [b''] * _NUM_SECTIONS
+    sections[_PARAMS] = json.dumps(model['params'], sort_keys=True).encode('utf-8')
+
+    # symbols, found by key for get_id and by id through their position in the key table
+    symbol_keys = [_symbol_key(symbol) for symbol in model['symbols']]
+    order = _key_table_order(symbol_keys)
+    positions = array('i', bytes(4 * len(order)))
+    for position, sid in enumerate(order):
+        positions[sid] = position
+    _key_table_sections(sections, _SYMBOL_KEYS, [symbol_keys[sid] for sid in order])
+    sections[_SYMBOL_KEY_IDS] = array('i', order).tobytes()
+    sections[_SYMBOL_POSITIONS] = positions.tobytes()
+
+    # the pool of morphs, components, and roots
+    pool_ids = {}
+    pool = []
+
+    def intern(string):
+        sid = pool_ids.get(string)
+        if sid is None:
+            sid = len(pool)
+            pool_ids[string] = sid
+            pool.append(string.encode('utf-8'))
+        return sid
+
+    # word frequencies
+    words = [word.encode('utf-8') for word in model['word_dict']]
+    freqs = list(model['word_dict'].values())
+    order = _key_table_order(words)
+    _key_table_sections(sections, _WORD_KEYS, [words[i] for i in order])
+    sections[_WORD_FREQS] = array('q', [freqs[i] for i in order]).tobytes()
+
+    # segmentations
+    seg_items = list(model['seg_dict'].items())
+    words = [word.encode('utf-8') for word, _seg in seg_items]
+    order = _key_table_order(words)
+    morph_offsets = array('q', [0])
+    morphs = array('i')
+    component_offsets = array('q', [0])
+    components = array('i')
+    for i in order:
+        seg_morphs, seg_components = seg_items[i][1]
+        morphs.extend(intern(morph) for morph in seg_morphs)
+        morph_offsets.append(len(morphs))
+        for component in seg_components:
+            components.extend(intern(part) for part in component)
+        component_offsets.append(len(components) // 3)
+    _key_table_sections(sections, _SEG_KEYS, [words[i] for i in order])
+    sections[_SEG_MORPH_OFFSETS] = morph_offsets.tobytes()
+    sections[_SEG_MORPHS] = morphs.tobytes()
+    sections[_SEG_COMPONENT_OFFSETS] = component_offsets.tobytes()
+    sections[_SEG_COMPONENTS] = components.tobytes()
+
+    # morphs and the words they could be the surface form of (see segcandidate.get_morph_dict)
+    morph_items = list(model['morph_dict'].items())
+    keys = [morph.encode('utf-8') for morph, _roots in morph_items]
+    order = _key_table_order(keys)
+    root_offsets = array('q', [0])
+    roots = array('i')
+    for i in order:
+        roots.extend(intern(root) for root in morph_items[i][1])
+        root_offsets.append(len(roots))
+    _key_table_sections(sections, _MORPH_KEYS, [keys[i] for i in order])
+    sections[_MORPH_ROOT_OFFSETS] = root_offsets.tobytes()
+    sections[_MORPH_ROOTS] = roots.tobytes()
+    sections[_POOL_OFFSETS], sections[_POOL_BYTES] = _pool_sections(pool)
+
+    # scores and probabilities, sorted by key for binary search
+    for ids_section, values_section, prob_dict in ((_SUFFIX_IDS, _SUFFIX_SCORES, model['suffix_dict']),
+                                                   (_ROOT_PROB_IDS, _ROOT_PROBS, model['probroots']),
+                                                   (_SUFFIX_PROB_IDS, _SUFFIX_PROBS, model['probsuffix'])):
+        items = sorted(prob_dict.items())
+        sections[ids_section] = array('i', [sid for sid, _value in items]).tobytes()
+        sections[values_section] = array('d', [value for _sid, value in items]).tobytes()
+    items = sorted((trans * PAIR_BASE + feat, prob) for (trans, feat), prob in model['probtrans'].items())
+    sections[_TRANS_PROB_KEYS] = array('q', [key for key, _prob in items]).tobytes()
+    sections[_TRANS_PROBS] = array('d', [prob for _key, prob in items]).tobytes()
+
+    with open(path, 'wb') as fout:
+        header_len = 16 + 16 * _NUM_SECTIONS
+        directory = []
+        offset = header_len
+        for section in sections:
+            offset += -offset % 8
+            directory.append((offset, len(section)))
+            offset += len(section)
+        fout.write(MAPPED_MAGIC)
+        fout.write(struct.pack('<II', MAPPED_VERSION, _NUM_SECTIONS))
+        for section_offset, section_len in directory:
+            fout.write(struct.pack('<QQ', section_offset, section_len))
+        position = header_len
+        for (section_offset, _section_len), section in zip(directory, sections):
+            fout.write(bytes(section_offset - position))
+            fout.write(section)
+            position = section_offset + len(section)
+
+
+class MappedStrings():
+    """A string pool in a mapped model."""
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def key(self, i):
+        """Return the bytes of string `i`."""
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        return self.key(i).decode('utf-8')
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+class MappedKeyTable(MappedStrings):
+    """A string pool sorted by bytes, with a hash index to find keys."""
+
+    def __init__(self, offsets, data, slots):
+        MappedStrings.__init__(self, offsets, data)
+        self.slots = slots
+        self.mask = len(slots) - 1
+
+    def find(self, key):
+        """Return the index of the encoded key, or -1 if it isn't in the table."""
+        offsets, data, slots, mask = self.offsets, self.data, self.slots, self.mask
+        slot = zlib.crc32(key) & mask
+        while True:
+            i = slots[slot]
+            if i < 0:
+                return -1
+            if data[offsets[i]:offsets[i + 1]] == key:
+                return i
+            slot = (slot + 1) & mask
+
+
+class MappedDict(Mapping):
+    """A read-only dictionary from strings to values, where the value of the key at index `i` of the key table is
+    `get_value(i)`."""
+
+    def __init__(self, key_table, get_value):
+        self.key_table = key_table
+        self.get_value = get_value
+
+    def __getitem__(self, key):
+        i = self.key_table.find(key.encode('utf-8'))
+        if i < 0:
+            raise KeyError(key)
+        return self.get_value(i)
+
+    def __contains__(self, key):
+        return self.key_table.find(key.encode('utf-8')) >= 0
+
+    def __iter__(self):
+        for i in range(len(self.key_table)):
+            yield self.key_table[i]
+
+    def __len__(self):
+        return len(self.key_table)
+
+
+class MappedIdDict(Mapping):
+    """A read-only dictionary from integer keys (sorted in `keys`) to the floats in `values`."""
+
+    def __init__(self, keys, values):
+        self.sorted_keys = keys
+        self.sorted_values = values
+
+    def _find(self, key):
+        i = bisect.bisect_left(self.sorted_keys, key)
+        if i < len(self.sorted_keys) and self.sorted_keys[i] == key:
+            return i
+        return -1
+
+    def __getitem__(self, key):
+        i = self._find(key)
+        if i < 0:
+            raise KeyError(key)
+        return self.sorted_values[i]
+
+    def __contains__(self, key):
+        return key is not None and self._find(key) >= 0
+
+    def __iter__(self):
+        return iter(self.sorted_keys.tolist())
+
+    def __len__(self):
+        return len(self.sorted_keys)
+
+
+class MappedPairDict(MappedIdDict):
+    """A read-only dictionary from (trans id, feature id) pairs to floats, stored by their pair codes (see
+    bayesian.PAIR_BASE)."""
+
+    def __getitem__(self, key):
+        return MappedIdDict.__getitem__(self, key[0] * PAIR_BASE + key[1])
+
+    def __contains__(self, key):
+        return key[0] is not None and key[1] is not None and self._find(key[0] * PAIR_BASE + key[1]) >= 0
+
+    def __iter__(self):
+        for code in self.sorted_keys.tolist():
+            yield (code // PAIR_BASE, code % PAIR_BASE)
+
+
+class MappedSymbolTable():
+    """The read-only SymbolTable of a mapped model."""
+
+    def __init__(self, key_table, key_ids, positions):
+        self.key_table = key_table
+        self.key_ids = key_ids  # maps each position in the key table to its symbol id
+        self.positions = positions  # maps each symbol id to its position in the key table
+
+    def get_id(self, symbol):
+        """Return the id of the symbol, or None if it isn't in the table."""
+        i = self.key_table.find(_symbol_key(symbol))
+        return self.key_ids[i] if i >= 0 else None
+
+    @property
+    def symbols(self):
+        """The list of all symbols, in id order."""
+        return [self[sid] for sid in range(len(self))]
+
+    def __getitem__(self, sid):
+        return _key_symbol(self.key_table.key(self.positions[sid]))
+
+    def __contains__(self, symbol):
+        return self.get_id(symbol) is not None
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class MappedModel():
+    """A model file in the mapped format, opened with mmap.
+
+    The dictionaries are views of the mapping, so opening the file is cheap, lookups only touch the pages they need,
+    and processes that open the same file share its pages.
+    """
+
+    def __init__(self, path):
+        """Map the file at `path`."""
+        if sys.byteorder != 'little':
+            raise ValueError('Mapped models can only be read on little-endian machines')
+        with open(path, 'rb') as fin:
+            self.mmap = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+        if bytes(buffer[:len(MAPPED_MAGIC)]) != MAPPED_MAGIC:
+            raise ValueError('%s is not a mapped model file' % path)
+        version, num_sections = struct.unpack_from('<II', buffer, len(MAPPED_MAGIC))
+        if version != MAPPED_VERSION or num_sections != _NUM_SECTIONS:
+            raise ValueError('Unsupported mapped model version %s in %s (expected %s)' % (version, path,
+                                                                                         MAPPED_VERSION))
+        self.sections = []
+        for i in range(num_sections):
+            offset, length = struct.unpack_from('<QQ', buffer, 16 + 16 * i)
+            self.sections.append(buffer[offset:offset + length])
+
+        self.params = json.loads(bytes(self.sections[_PARAMS]).decode('utf-8'))
+        self.symbols = MappedSymbolTable(self.__key_table(_SYMBOL_KEYS),
+                                         self.__array(_SYMBOL_KEY_IDS, 'i'), self.__array(_SYMBOL_POSITIONS, 'i'))
+        self.pool = MappedStrings(self.__array(_POOL_OFFSETS, 'q'), self.sections[_POOL_BYTES])
+
+        freqs = self.__array(_WORD_FREQS, 'q')
+        self.word_dict = MappedDict(self.__key_table(_WORD_KEYS), freqs.__getitem__)
+        self.seg_dict = MappedDict(self.__key_table(_SEG_KEYS), self.__get_seg)
+        self.morph_dict = MappedDict(self.__key_table(_MORPH_KEYS), self.__get_roots)
+        self.suffix_dict = MappedIdDict(self.__array(_SUFFIX_IDS, 'i'), self.__array(_SUFFIX_SCORES, 'd'))
+        self.probroots = MappedIdDict(self.__array(_ROOT_PROB_IDS, 'i'), self.__array(_ROOT_PROBS, 'd'))
+        self.probsuffix = MappedIdDict(self.__array(_SUFFIX_PROB_IDS, 'i'), self.__array(_SUFFIX_PROBS, 'd'))
+        self.probtrans = MappedPairDict(self.__array(_TRANS_PROB_KEYS, 'q'), self.__array(_TRANS_PROBS, 'd'))
+        self.__seg_morph_offsets = self.__array(_SEG_MORPH_OFFSETS, 'q')
+        self.__seg_morphs = self.__array(_SEG_MORPHS, 'i')
+        self.__seg_component_offsets = self.__array(_SEG_COMPONENT_OFFSETS, 'q')
+        self.__seg_components = self.__array(_SEG_COMPONENTS, 'i')
+        self.__morph_root_offsets = self.__array(_MORPH_ROOT_OFFSETS, 'q')
+        self.__morph_roots = self.__array(_MORPH_ROOTS, 'i')
+
+    def __array(self, section, typecode):
+        """Return a section as a typed view."""
+        return self.sections[section].cast(typecode)
+
+    def __key_table(self, first):
+        """Return the key table whose sections start at `first`."""
+        return MappedKeyTable(self.__array(first, 'q'), self.sections[first + 1], self.__array(first + 2, 'i'))
+
+    def __get_seg(self, i):
+        """Decode the segmentation at index `i` of the segmentation key table."""
+        pool = self.pool
+        morph_offsets, component_offsets = self.__seg_morph_offsets, self.__seg_component_offsets
+        morphs = tuple(pool[sid] for sid in self.__seg_morphs[morph_offsets[i]:morph_offsets[i + 1]])
+        parts = [pool[sid] for sid in self.__seg_components[3 * component_offsets[i]:3 * component_offsets[i + 1]]]
+        return morphs, tuple(zip(parts[0::3], parts[1::3], parts[2::3]))
+
+    def __get_roots(self, i):
+        """Decode the roots at index `i` of the morph key table."""
+        root_offsets = self.__morph_root_offsets
+        return [self.pool[sid] for sid in self.__morph_roots[root_offsets[i]:root_offsets[i + 1]]]
+
+
+def is_mapped_model(path):
+    """Return whether the file at `path` is a mapped model."""
+    with open(path, 'rb') as fin:
+        return fin.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
@@ -0,0 +1,262 @@
+'''Reading and writing trained models in a compact, versioned binary format. Created on Oct 17, 2026.
+'''
+
+
+import hashlib
+import json
+import struct
+import sys
+from array import array
+
+
+MODEL_MAGIC = b'PARAMA\x00M'
+MODEL_VERSION = 1
+
+# Layout (all integers little-endian):
+#   magic (8 bytes), version (uint32)
+#   params: uint32 byte length, then a UTF-8 JSON object of the Parameter attributes
+#   symbols: the arity of each symbol (uint8 array; 0 for strings, 2 for features, which are pairs of strings) and a
+#       string list of the strings and feature parts of the SymbolTable, in id order
+#   strings: a string list (the pool of words, morphs, and components of the word and segmentation dictionaries)
+#   word dictionary: word pool ids (int32 array), frequencies (int64 array)
+#   segmentation dictionary: word pool ids (int32), morph offsets (int64), morph pool ids (int32), component offsets
+#       (int64), component pool ids (int32, three per component: root, trans, suffix)
+#   suffix scores, root probabilities, suffix probabilities: symbol ids (int32 array), values (float64 array)
+#   transformation probabilities: trans ids (int32 array), feature ids (int32 array), values (float64 array)
+# A string list is a uint32 count, the UTF-8 byte length of each string (uint32 array), and the concatenated bytes.
+# An array is a one-byte typecode, a uint64 item count, and the items.
+
+
+def _write_array(fout, typecode, items):
+    """Write a typed array."""
+    items = array(typecode, items)
+    fout.write(struct.pack('<cQ', typecode.encode('ascii'), len(items)))
+    if sys.byteorder == 'big':
+        items.byteswap()
+    fout.write(items.tobytes())
+
+
+def _read_array(fin, typecode):
+    """Read a typed array, checking that it has the expected typecode."""
+    code, count = struct.unpack('<cQ', fin.read(9))
+    if code.decode('ascii') != typecode:
+        raise ValueError('Corrupt model file: expected an array of %r, found %r' % (typecode, code))
+    items = array(typecode)
+    items.frombytes(fin.read(count * items.itemsize))
+    if len(items) != count:
+        raise ValueError('Corrupt model file: truncated array')
+    if sys.byteorder == 'big':
+        items.byteswap()
+    return items
+
+
+def _write_strings(fout, strings):
+    """Write a list of strings."""
+    encoded = [string.encode('utf-8') for string in strings]
+    fout.write(struct.pack('<I', len(encoded)))
+    _write_array(fout, 'I', [len(data) for data in encoded])
+    fout.write(b''.join(encoded))
+
+
+def _read_strings(fin):
+    """Read a list of strings."""
+    (count,) = struct.unpack('<I', fin.read(4))
+    lengths = _read_array(fin, 'I')
+    if len(lengths) != count:
+        raise ValueError('Corrupt model file: string list length mismatch')
+    data = fin.read(sum(lengths))
+    strings = []
+    start = 0
+    for length in lengths:
+        strings.append(data[start:start + length].decode('utf-8'))
+        start += length
+    return strings
+
+
+def _write_symbols(fout, symbols):
+    """Write the symbols of a SymbolTable, which are strings or pairs of strings (features)."""
+    arities = []
+    parts = []
+    for symbol in symbols:
+        if isinstance(symbol, tuple):
+            arities.append(len(symbol))
+            parts.extend(symbol)
+        else:
+            arities.append(0)
+            parts.append(symbol)
+    _write_array(fout, 'B', arities)
+    _write_strings(fout, parts)
+
+
+def _read_symbols(fin):
+    """Read the symbols of a SymbolTable."""
+    arities = _read_array(fin, 'B')
+    parts = _read_strings(fin)
+    symbols = []
+    start = 0
+    for arity in arities:
+        if arity:
+            symbols.append(tuple(parts[start:start + arity]))
+            start += arity
+        else:
+            symbols.append(parts[start])
+            start += 1
+    return symbols
+
+
+def _write_prob_dict(fout, prob_dict):
+    """Write a dictionary from symbol ids to floats."""
+    _write_array(fout, 'i', prob_dict.keys())
+    _write_array(fout, 'd', prob_dict.values())
+
+
+def _read_prob_dict(fin):
+    """Read a dictionary from symbol ids to floats."""
+    ids = _read_array(fin, 'i')
+    values = _read_array(fin, 'd')
+    return dict(zip(ids.tolist(), values.tolist()))
+
+
+class _StringPool():
+    """Assigns ids to the strings of the word and segmentation dictionaries, so each is stored once."""
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, string):
+        sid = self.ids.get(string)
+        if sid is None:
+            sid = len(self.strings)
+            self.ids[string] = sid
+            self.strings.append(string)
+        return sid
+
+
+def save_model(path, model):
+    """Write a model to `path` (see write_model)."""
+    with open(path, 'wb') as fout:
+        write_model(fout, model)
+
+
+class _HashWriter():
+    """A file-like object that feeds what's written to it into a hash."""
+
+    def __init__(self, hash_object):
+        self.hash_object = hash_object
+
+    def write(self, data):
+        self.hash_object.update(data)
+
+
+def model_fingerprint(model):
+    """Return a hex digest identifying the contents of a model (as given to write_model)."""
+    hash_object = hashlib.sha256()
+    write_model(_HashWriter(hash_object), model)
+    return hash_object.hexdigest()
+
+
+def file_fingerprint(path, block_size=1 << 20):
+    """Return a hex digest identifying the contents of a model file."""
+    hash_object = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for block in iter(lambda: fin.read(block_size), b''):
+            hash_object.update(block)
+    return hash_object.hexdigest()
+
+
+def write_model(fout, model):
+    """Write a model to the binary file `fout`.
+
+    `model` is a dictionary with the keys:
+        params: a dictionary of the Parameter attributes
+        symbols: the list of symbols of the SymbolTable, in id order
+        word_dict: the word frequency dictionary
+        seg_dict: the segmentation dictionary, mapping words to (morphs, components)
+        suffix_dict: the suffix scores of the TokenAnalyzer, keyed by suffix id
+        probroots, probsuffix: the root and suffix probabilities, keyed by id
+        probtrans: the transformation probabilities, keyed by (trans id, feature id)
+    """
+    pool = _StringPool()
+    word_ids = [pool.intern(word) for word in model['word_dict']]
+    seg_word_ids = []
+    morph_offsets = [0]
+    morph_ids = []
+    component_offsets = [0]
+    component_ids = []
+    for word, (morphs, components) in model['seg_dict'].items():
+        seg_word_ids.append(pool.intern(word))
+        morph_ids.extend(pool.intern(morph) for morph in morphs)
+        morph_offsets.append(len(morph_ids))
+        for component in components:
+            component_ids.extend(pool.intern(part) for part in component)
+        component_offsets.append(len(component_ids) // 3)
+
+    fout.write(MODEL_MAGIC)
+    fout.write(struct.pack('<I', MODEL_VERSION))
+    params = json.dumps(model['params'], sort_keys=True).encode('utf-8')
+    fout.write(struct.pack('<I', len(params)))
+    fout.write(params)
+    _write_symbols(fout, model['symbols'])
+    _write_strings(fout, pool.strings)
+    _write_array(fout, 'i', word_ids)
+    _write_array(fout, 'q', model['word_dict'].values())
+    _write_array(fout, 'i', seg_word_ids)
+    _write_array(fout, 'q', morph_offsets)
+    _write_array(fout, 'i', morph_ids)
+    _write_array(fout, 'q', component_offsets)
+    _write_array(fout, 'i', component_ids)
+    _write_prob_dict(fout, model['suffix_dict'])
+    _write_prob_dict(fout, model['probroots'])
+    _write_prob_dict(fout, model['probsuffix'])
+    probtrans = model['probtrans']
+    _write_array(fout, 'i', [trans for trans, _feat in probtrans])
+    _write_array(fout, 'i', [feat for _trans, feat in probtrans])
+    _write_array(fout, 'd', probtrans.values())
+
+
+def load_model(path):
+    """Read a model written by save_model, returning a dictionary with the same keys."""
+    with open(path, 'rb') as fin:
+        if fin.read(len(MODEL_MAGIC)) != MODEL_MAGIC:
+            raise ValueError('%s is not a model file' % path)
+        (version,) = struct.unpack('<I', fin.read(4))
+        if version != MODEL_VERSION:
+            raise ValueError('Unsupported model version %s in %s (expected %s)' % (version, path, MODEL_VERSION))
+        (params_len,) = struct.unpack('<I', fin.read(4))
+        params = json.loads(fin.read(params_len).decode('utf-8'))
+        symbols = _read_symbols(fin)
+        strings = _read_strings(fin)
+        word_ids = _read_array(fin, 'i')
+        freqs = _read_array(fin, 'q')
+        seg_word_ids = _read_array(fin, 'i')
+        morph_offsets = _read_array(fin, 'q')
+        morph_ids = _read_array(fin, 'i')
+        component_offsets = _read_array(fin, 'q')
+        component_ids = _read_array(fin, 'i')
+        suffix_dict = _read_prob_dict(fin)
+        probroots = _read_prob_dict(fin)
+        probsuffix = _read_prob_dict(fin)
+        trans_ids = _read_array(fin, 'i')
+        feat_ids = _read_array(fin, 'i')
+        trans_probs = _read_array(fin, 'd')
+
+    word_dict = dict(zip([strings[sid] for sid in word_ids], freqs.tolist()))
+    morphs = [strings[sid] for sid in morph_ids]
+    parts = [strings[sid] for sid in component_ids]
+    components = list(zip(parts[0::3], parts[1::3], parts[2::3]))
+    seg_dict = {}
+    for i, sid in enumerate(seg_word_ids):
+        seg_dict[strings[sid]] = (tuple(morphs[morph_offsets[i]:morph_offsets[i + 1]]),
+                                  tuple(components[component_offsets[i]:component_offsets[i + 1]]))
+    probtrans = dict(zip(zip(trans_ids.tolist(), feat_ids.tolist()), trans_probs.tolist()))
+    return {
+        'params': params,
+        'symbols': symbols,
+        'word_dict': word_dict,
+        'seg_dict': seg_dict,
+        'suffix_dict': suffix_dict,
+        'probroots': probroots,
+        'probsuffix': probsuffix,
+        'probtrans': probtrans,
+        }
@@ -5,14 +5,25 @@ Created on Jun 11, 2018
 '''
 
 
-from segcandidate import TokenAnalyzer
-from bayesian import get_initial_parameters, estimate_suffix_probability, do_step1_segmention
+from bisect import bisect_left
+from contextlib import nullcontext
+from heapq import merge
+from itertools import islice
+from segcandidate import TokenAnalyzer, TransRuleIndex, LazyTransRuleIndex, CandidateLattice
+from bayesian import get_initial_parameters, estimate_suffix_probability, do_step1_segmention, do_em_segmentation
+from bayesian import count_initial_parameters, normalize_initial_parameters, PriorCounts
 from bayesian import calc_seg_probs, calc_seg_prob
 from segmentation import get_seg_dict_by_paradigms
 from pruning import prune_paradigms
-from suffixcandidate import gen_N_best_suffix, calc_suf_score_by_dist
-from paradigm import create_paradigms, get_paradigm_suffix_sets, get_reliable_suffix_tuples
+from suffixcandidate import gen_N_best_suffix, calc_suf_score_by_dist, calc_suf_score_by_matrix
+from paradigm import create_paradigms, get_paradigm_suffix_sets, get_reliable_suffix_tuples, ParadigmMatrix
 from reliableroot import is_reliable_root
+from symbols import SymbolTable, SymbolBits
+from modelio import save_model, load_model, model_fingerprint, file_fingerprint
+from mappedmodel import save_mapped_model, is_mapped_model, MappedModel
+from param import Parameter, PERFORMANCE_PARAMETERS
+from caches import LRUCache, PersistentSegCache
+from workers import worker_pool, get_shared, imap_bounded
 
 
 class MorphAnalyzer():
@@ -27,6 +38,15 @@ class MorphAnalyzer():
         self.__probroots = None
         self.__probsuffix = None
         self.__probtrans = None
+        # segmentations of subtokens that aren't in the segmentation dictionary
+        self.__oov_cache = LRUCache(param.OOVCacheSize)
+        self.__fingerprint = None  # computed when needed (see fingerprint)
+        self.__mapped_path = None  # the file of a mapped model
+        # what update needs from training, which saved models don't keep
+        self.__prior_counts = None  # the PriorCounts of the candidates of all words
+        self.__resolved_segs = None  # a CandidateLattice of the chosen segmentation of each word
+        self.__paradigm_state = None  # the reliable and single suffix tuples and the SymbolBits of bootstrapping
+        self.__sorted_words = None  # the words of the word dictionary in sorted order, made by the first update
 
     def __get_frequent_long_words(self, word_dict):
         """Collect a word frequency dictionary of words of length greater than 4 and appearing more than 3 times."""
@@ -40,35 +60,58 @@ class MorphAnalyzer():
             new_word_dict[word] = freq
         return new_word_dict
 
-    def __get_reliable_paradigm_suffixes(self, word_dict):
-        """Use long and frequent words to generate an initial set of suffixes."""
+    def __get_reliable_paradigm_suffixes(self, word_dict, symbols, suffix_bits):
+        """Use long and frequent words to generate an initial set of suffixes.
+
+        Suffixes and roots are interned in `symbols`, and the results are keyed by their ids. Suffix tuples are bitmasks
+        over positions from `suffix_bits`.
+        """
         print('--get reliable words')
         reliable_word_dict = self.__get_frequent_long_words(word_dict)
         print('--create token analyzer')
         prior_prob_suffix = {}
-        suffix_dict = dict(gen_N_best_suffix(word_dict, min_stem_len=self.param.MinStemLen,
-                                             max_suf_len=self.param.MaxSuffixLen, best_N=self.param.BestNCandSuffix))
+        best_suffixes = gen_N_best_suffix(word_dict, min_stem_len=self.param.MinStemLen,
+                                          max_suf_len=self.param.MaxSuffixLen, best_N=self.param.BestNCandSuffix,
+                                          num_workers=self.param.NumWorkers)
+        suffix_dict = dict((symbols.intern(suffix), score) for suffix, score in best_suffixes)
+        # the transformation rules only depend on the words, so they're shared by the analyzers of each iteration
+        rule_index = TransRuleIndex(reliable_word_dict, self.param.MinStemLen, self.param.MaxSuffixLen)
         itr = 0
-        while itr < 2:
+        while itr < self.param.BootstrapIterations:
             itr += 1
             ta = TokenAnalyzer(reliable_word_dict, suffix_dict, self.param.MinStemLen, self.param.MaxSuffixLen,
-                               self.param.UseTransRules)
-            print('--analyze possible segmentations for tokens')
-            token_segs = ta.analyze_token_list(reliable_word_dict.keys())
+                               self.param.UseTransRules, symbols, rule_index)
+            if self.param.StreamCandidates:
+                print('--analyze and segment tokens in two streaming passes')
+                resolved_segs, probroots, probsuffix, probtrans = self.__stream_segmentation(
+                    ta, reliable_word_dict.keys(), prior_prob_suffix or None)
+            else:
+                print('--analyze possible segmentations for tokens')
+                token_segs = ta.analyze_token_list(reliable_word_dict.keys(), self.param.NumWorkers)
 
-            print('--get initial parameters')  # initial probabilities for roots, suffixes, and transitions
-            probroots, probsuffix, probtrans = get_initial_parameters(token_segs)
-            if prior_prob_suffix:
-                probsuffix = prior_prob_suffix  # (???)
+                print('--get initial parameters')  # initial probabilities for roots, suffixes, and transitions
+                probroots, probsuffix, probtrans = get_initial_parameters(token_segs)
+                if prior_prob_suffix:
+                    probsuffix = prior_prob_suffix  # (???)
 
-            print('--segment tokens')  # get the most likely segmentation from those listed as possible in `token_segs`
-            resolved_segs = do_step1_segmention(token_segs, probroots, probsuffix, probtrans)
+                # get the most likely segmentation from those listed as possible in `token_segs` (EM isn't run here,
+                # so that the suffix probabilities of the previous iteration are kept)
+                print('--segment tokens')
+                resolved_segs = do_step1_segmention(token_segs, probroots, probsuffix, probtrans)
 
             print('--create paradigms')
-            paradigm_dict, _atomic_word_dict = create_paradigms(resolved_segs)
-
-            print('--get paradigm suffix sets')  # get a set of suffixes for each root
-            root_suffix_set_list = get_paradigm_suffix_sets(paradigm_dict)
+            if self.param.ParadigmMatrix:
+                paradigm_matrix, _atomic_word_dict = ParadigmMatrix.from_lattice(resolved_segs)
+                # drop the rare suffixes by their paradigm support (column sums) before collecting the sets
+                print('--get paradigm suffix sets')  # get a set of suffixes for each root
+                paradigm_matrix = paradigm_matrix.filter_rare_suffixes(self.param.MinSuffixFreq)
+                root_suffix_set_list = paradigm_matrix.root_suffix_sets(suffix_bits)
+                min_suffix_freq = None  # already filtered
+            else:
+                paradigm_dict, _atomic_word_dict = create_paradigms(resolved_segs)
+                print('--get paradigm suffix sets')  # get a set of suffixes for each root
+                root_suffix_set_list = get_paradigm_suffix_sets(paradigm_dict, suffix_bits)
+                min_suffix_freq = self.param.MinSuffixFreq
 
             print('--prune paradigms')
             reliables, singles, reliable_affix_type_dict = get_reliable_suffix_tuples(
@@ -76,7 +119,9 @@ class MorphAnalyzer():
                 word_dict,
                 self.param.MinParadigmSupport,
                 self.param.MinParadigmSuffix,
-                self.param.MinSuffixFreq
+                min_suffix_freq,
+                symbols,
+                suffix_bits
                 )
             suffix_dict = reliable_affix_type_dict
 
@@ -85,6 +130,39 @@ class MorphAnalyzer():
 
         return reliables, singles, reliable_affix_type_dict
 
+    def __segment_candidates(self, token_segs, probroots, probsuffix, probtrans):
+        """Choose the most likely segmentation of each token in the final segmentation of training, re-estimating the
+        model with hard EM if self.param.EMIterations is set."""
+        if self.param.EMIterations > 0:
+            resolved_segs, _changes = do_em_segmentation(token_segs, probroots, probsuffix, probtrans,
+                                                         self.param.EMIterations, self.param.EMMinChange)
+            return resolved_segs
+        return do_step1_segmention(token_segs, probroots, probsuffix, probtrans)
+
+    def __stream_segmentation(self, ta, token_list, prior_prob_suffix=None, counts=None):
+        """Get the initial parameters and the most likely segmentation of each token without holding the candidates of
+        all tokens at once.
+
+        The first pass over `token_list` generates candidates in batches and accumulates the initial parameters (into
+        `counts`, a PriorCounts, if it's given). The second pass generates them again and keeps only the best
+        segmentation of each token. If `prior_prob_suffix` is given, it's used instead of the estimated suffix
+        probabilities. The results are the same as those of get_initial_parameters and do_step1_segmention over the
+        whole list.
+        """
+        batch_size = self.param.StreamBatchSize
+        if counts is None:
+            counts = PriorCounts()
+        for token_segs in ta.analyze_token_batches(token_list, batch_size, self.param.NumWorkers):
+            count_initial_parameters(token_segs, counts)
+        probroots, probsuffix, probtrans = normalize_initial_parameters(counts)
+        if prior_prob_suffix is not None:
+            probsuffix = prior_prob_suffix
+
+        resolved_segs = CandidateLattice(ta.symbols)
+        for token_segs in ta.analyze_token_batches(token_list, batch_size, self.param.NumWorkers):
+            resolved_segs.extend(do_step1_segmention(token_segs, probroots, probsuffix, probtrans))
+        return resolved_segs, probroots, probsuffix, probtrans
+
     def __strip_apostrophe(self, token):
         """Split before an apostrophe, ensuring it appears after any hyphen."""
         apostrophe = ''
@@ -197,7 +275,7 @@ class MorphAnalyzer():
         max_prob = 0.0
         best_ts = None
         for ts in segs:
-            prob = calc_seg_prob(ts, probroots, probsuffix, probtrans)
+            prob = calc_seg_prob(ts, probroots, probsuffix, probtrans, ta.symbols)
             if prob > max_prob:
                 max_prob = prob
                 best_ts = ts
@@ -253,9 +331,16 @@ class MorphAnalyzer():
             if not subtoken:
                 continue
 
-            # segment the subtoken, and add the morphs and components to the list
-            seg_subtoken_morphs, seg_subtoken_components = self.__segment_simple_token(
-                subtoken, seg_dict, ta, probroots, probsuffix, probtrans)
+            # segment the subtoken (looking up unknown subtokens in the cache), and add the morphs and components to
+            # the list
+            if subtoken in seg_dict:
+                seg_subtoken = seg_dict[subtoken]
+            else:
+                seg_subtoken = self.__oov_cache.get(subtoken)
+                if seg_subtoken is None:
+                    seg_subtoken = self.__segment_simple_token(subtoken, seg_dict, ta, probroots, probsuffix, probtrans)
+                    self.__oov_cache.put(subtoken, seg_subtoken)
+            seg_subtoken_morphs, seg_subtoken_components = seg_subtoken
             morphs.extend(seg_subtoken_morphs)
             components.extend(seg_subtoken_components)
 
@@ -281,11 +366,19 @@ class MorphAnalyzer():
 
     def train(self, train_word_freq_list):
         """Create a model from the given word frequency list."""
+        if self.param.BootstrapIterations < 1:
+            # the reliable suffixes that training starts from only come out of bootstrapping
+            raise ValueError('BootstrapIterations must be at least 1, not %s' % self.param.BootstrapIterations)
         # create the word frequency dictionary, parsing hyphens and apostrophes as determined by self.params
         train_dict = self.__process_tokens(train_word_freq_list)
+        # the model is keyed by ids of roots, suffixes, and transformations from this table
+        symbols = SymbolTable()
+        # and sets of suffixes are bitmasks over positions from this one
+        suffix_bits = SymbolBits()
 
         # get paradigms with reliable suffixes
-        reliable_suffix_tuples, single_suffix_tuples, suffix_dict = self.__get_reliable_paradigm_suffixes(train_dict)
+        reliable_suffix_tuples, single_suffix_tuples, suffix_dict = self.__get_reliable_paradigm_suffixes(
+            train_dict, symbols, suffix_bits)
 
         print('| Generate tokens candidate segmentations')
         token_analyzer = TokenAnalyzer(
@@ -293,25 +386,68 @@ class MorphAnalyzer():
             suffix_dict,
             self.param.MinStemLen,
             self.param.MaxSuffixLen,
-            self.param.UseTransRules)
-        token_segs = token_analyzer.analyze_token_list(train_dict.keys())
-
-        print('| Obtain statistics')
-        probroots, _probsuffix, probtrans = get_initial_parameters(token_segs)
-        probsuffix = estimate_suffix_probability(suffix_dict)
+            self.param.UseTransRules,
+            symbols)
+        # the counts behind the root and transformation probabilities are kept for update
+        prior_counts = PriorCounts()
+        if self.param.StreamCandidates:
+            print('| Obtain statistics and segment tokens in two streaming passes')
+            resolved_segs, probroots, probsuffix, probtrans = self.__stream_segmentation(
+                token_analyzer, train_dict.keys(), estimate_suffix_probability(suffix_dict), prior_counts)
+        else:
+            token_segs = token_analyzer.analyze_token_list(train_dict.keys(), self.param.NumWorkers)
+
+            print('| Obtain statistics')
+            probroots, _probsuffix, probtrans = normalize_initial_parameters(
+                count_initial_parameters(token_segs, prior_counts))
+            probsuffix = estimate_suffix_probability(suffix_dict)
+
+            print('| Segment tokens')
+            resolved_segs = self.__segment_candidates(token_segs, probroots, probsuffix, probtrans)
+
+        seg_dict = self.__get_seg_dict(resolved_segs, train_dict, symbols, suffix_bits, reliable_suffix_tuples,
+                                       single_suffix_tuples)
 
-        print('| Segment tokens')
-        resolved_segs = do_step1_segmention(token_segs, probroots, probsuffix, probtrans)
+        # combine reliable suffix tuples and single suffix tuples into one dictionary (Why???)
+        suffix_tuple_dict = {}
+        suffix_tuple_dict.update(reliable_suffix_tuples)
+        suffix_tuple_dict.update(single_suffix_tuples)
 
+        self.__word_dict = train_dict
+        self.__seg_dict = seg_dict
+        self.__ta = token_analyzer
+        self.__probroots = probroots
+        self.__probsuffix = probsuffix
+        self.__probtrans = probtrans
+        self.__prior_counts = prior_counts
+        self.__resolved_segs = resolved_segs
+        self.__paradigm_state = (reliable_suffix_tuples, single_suffix_tuples, suffix_bits)
+        self.__sorted_words = None
+        # segmentations cached with the previous model are no longer valid
+        self.__oov_cache.clear()
+        self.__fingerprint = None
+
+    def __get_seg_dict(self, resolved_segs, train_dict, symbols, suffix_bits, reliable_suffix_tuples,
+                       single_suffix_tuples):
+        """Create the paradigms of the chosen segmentations in `resolved_segs`, prune them, and return the segmentation
+        dictionary they give."""
         print('| Create paradigms')
-        paradigm_dict, atomic_word_dict = create_paradigms(resolved_segs)
+        if self.param.ParadigmMatrix:
+            paradigm_matrix, atomic_word_dict = ParadigmMatrix.from_lattice(resolved_segs)
+        else:
+            paradigm_dict, atomic_word_dict = create_paradigms(resolved_segs)
 
         # print('| Recalculate seg probability')
         # token_seg_probs = calc_seg_probs(token_segs, probroots, probsuffix, probtrans)
         # token_seg_prob_dict = dict(token_seg_probs)
 
         print('| Calculate suffix score')  # using the distribution of root lengths
-        suffix_type_score = calc_suf_score_by_dist(paradigm_dict)
+        if self.param.ParadigmMatrix:
+            suffix_type_score = calc_suf_score_by_matrix(paradigm_matrix, symbols)
+            # pruning and segmentation work on the dictionary form
+            paradigm_dict = paradigm_matrix.to_paradigm_dict()
+        else:
+            suffix_type_score = calc_suf_score_by_dist(paradigm_dict, symbols)
 
         if self.param.DoPruning:
             print('| Prune paradigms')
@@ -321,25 +457,229 @@ class MorphAnalyzer():
                 suffix_type_score,
                 single_suffix_tuples,
                 train_dict,
-                self.param.ExcludeUnreliable)
+                self.param.ExcludeUnreliable,
+                symbols,
+                suffix_bits)
 
         print('| Get segmentation dictionary')
         # use the paradigms to get a map from words to their segmentation structure
-        seg_dict = get_seg_dict_by_paradigms(paradigm_dict)
+        seg_dict = get_seg_dict_by_paradigms(paradigm_dict, symbols)
         # add the atomic words to the list
         seg_dict.update(atomic_word_dict)
+        return seg_dict
 
-        # combine reliable suffix tuples and single suffix tuples into one dictionary (Why???)
-        suffix_tuple_dict = {}
-        suffix_tuple_dict.update(reliable_suffix_tuples)
-        suffix_tuple_dict.update(single_suffix_tuples)
+    def update(self, word_freq_list):
+        """Fold the words of a word frequency list into the trained model, without training again.
+
+        Frequencies are added to those of the words already known. Only the words whose candidate segmentations change
+        (the new words, and the known words that the new words give new roots to or block roots for) are segmented
+        again, using root and transformation probabilities from the updated prior counts, and then the paradigms are
+        rebuilt from the segmentations of all words. The suffixes, their probabilities, and the reliable paradigm
+        suffixes stay as they were found in training, and EM isn't run again, so the model should still be trained
+        again from time to time.
+
+        Only a model trained by this analyzer can be updated, since saved models don't keep the prior counts. Returns
+        the number of words whose entries in the segmentation dictionary were changed, added, or removed.
+        """
+        if self.__prior_counts is None:
+            raise ValueError('Only a model trained by this analyzer can be updated')
+        param = self.param
+        word_dict = self.__word_dict
+        ta = self.__ta
+        update_dict = self.__process_tokens(word_freq_list)
+        new_words = [word for word in update_dict if word not in word_dict]
+
+        print('| Find the words whose candidates change')
+        if self.__sorted_words is None:
+            self.__sorted_words = sorted(word_dict)
+        affected_words = self.__get_affected_words(new_words)
+        old_candidates = [ta.get_candidates(word) for word in affected_words]
+
+        # add the words, and look their roots up in the dictionaries from now on, since the rule index built in
+        # training only knows the blocked suffixes of the words it was built for
+        for word, freq in update_dict.items():
+            word_dict[word] = word_dict.get(word, 0) + freq
+        for word in new_words:
+            if len(word) > param.MinStemLen:
+                if word[:-1] in ta.morph_dict:
+                    ta.morph_dict[word[:-1]].append(word)
+                else: ta.morph_dict[word[:-1]] = [word]
+        if not isinstance(ta.rule_index, LazyTransRuleIndex):
+            ta.rule_index = LazyTransRuleIndex(word_dict, ta.morph_dict, param.MinStemLen, param.MaxSuffixLen)
+        self.__sorted_words = list(merge(self.__sorted_words, sorted(new_words)))
+
+        # replace the counts of the old candidates of the changed words with those of their new ones
+        removed_segs = CandidateLattice(ta.symbols)
+        changed_segs = CandidateLattice(ta.symbols)
+        for word, candidates in zip(affected_words, old_candidates):
+            new_candidates = ta.get_candidates(word)
+            if new_candidates != candidates:
+                removed_segs.append(word, candidates)
+                changed_segs.append(word, new_candidates)
+        new_segs = ta.analyze_token_list(new_words)
+        counts = self.__prior_counts
+        counts.remove(removed_segs)
+        counts.add(changed_segs)
+        counts.add(new_segs)
+        probroots, _probsuffix, probtrans = normalize_initial_parameters(counts)
+
+        print('| Segment %s changed and %s new words' % (len(changed_segs), len(new_segs)))
+        resolved_segs = self.__resolved_segs
+        token_ids = dict(zip(resolved_segs.tokens, range(len(resolved_segs))))
+        best_segs = do_step1_segmention(changed_segs, probroots, self.__probsuffix, probtrans)
+        for i, word in enumerate(best_segs.tokens):
+            resolved_segs.assign(token_ids[word], best_segs, i)
+        resolved_segs.extend(do_step1_segmention(new_segs, probroots, self.__probsuffix, probtrans))
+
+        reliable_suffix_tuples, single_suffix_tuples, suffix_bits = self.__paradigm_state
+        seg_dict = self.__get_seg_dict(resolved_segs, word_dict, ta.symbols, suffix_bits, reliable_suffix_tuples,
+                                       single_suffix_tuples)
+        old_seg_dict = self.__seg_dict
+        num_changed = sum(1 for word, seg in seg_dict.items() if old_seg_dict.get(word) != seg)
+        num_changed += sum(1 for word in old_seg_dict if word not in seg_dict)
 
-        self.__word_dict = train_dict
         self.__seg_dict = seg_dict
-        self.__ta = token_analyzer
         self.__probroots = probroots
-        self.__probsuffix = probsuffix
         self.__probtrans = probtrans
+        # segmentations cached with the previous model are no longer valid
+        self.__oov_cache.clear()
+        self.__fingerprint = None
+        print('| %s segmentations changed' % num_changed)
+        return num_changed
+
+    def __get_affected_words(self, new_words):
+        """Return the known words whose candidate segmentations may change when `new_words` are added, in sorted order.
+
+        A new word `w` can be the root (possibly transformed) of the morphs of tokens starting with w[:-1], and it
+        blocks each known root `r = w[:-k]` for the suffix w[-k:], which is the root of the morphs of tokens starting
+        with r[:-1]. Such morphs are at most two characters longer than the prefix.
+        """
+        param = self.param
+        word_dict = self.__word_dict
+        prefixes = set()
+        for word in new_words:
+            if len(word) >= param.MinStemLen:
+                prefixes.add(word[:-1])
+            for suffix_len in range(2, min(param.MaxSuffixLen, len(word) - 1) + 1):
+                root = word[:-suffix_len]
+                if len(root) >= param.MinStemLen and root in word_dict:
+                    prefixes.add(root[:-1])
+
+        # the words starting with each prefix are a run of the sorted word list
+        sorted_words = self.__sorted_words
+        affected_words = set()
+        for prefix in prefixes:
+            max_len = len(prefix) + 2 + param.MaxSuffixLen
+            for i in range(bisect_left(sorted_words, prefix), len(sorted_words)):
+                word = sorted_words[i]
+                if not word.startswith(prefix):
+                    break
+                if len(word) <= max_len:
+                    affected_words.add(word)
+        return sorted(affected_words)
+
+    def __get_model(self):
+        """Collect the trained model into the dictionary form of modelio.write_model."""
+        params = dict((name, value) for name, value in vars(self.param).items() if name not in PERFORMANCE_PARAMETERS)
+        return {
+            'params': params,
+            'symbols': self.__ta.symbols.symbols,
+            'word_dict': self.__word_dict,
+            'seg_dict': self.__seg_dict,
+            'suffix_dict': self.__ta.suffix_dict,
+            'probroots': self.__probroots,
+            'probsuffix': self.__probsuffix,
+            'probtrans': self.__probtrans,
+            }
+
+    def save(self, path, mapped=False):
+        """Save the trained model to `path` (see modelio for the format).
+
+        If `mapped` is set, the model is saved in the read-only format of mappedmodel instead, which load maps into
+        memory rather than reading.
+        """
+        model = self.__get_model()
+        if mapped:
+            model['morph_dict'] = self.__ta.morph_dict
+            save_mapped_model(path, model)
+        else:
+            save_model(path, model)
+
+    @classmethod
+    def load(cls, path):
+        """Create an analyzer from a model saved with save, ready to segment tokens without training.
+
+        A model saved with `mapped` set is opened with mmap, and its dictionaries are used in place.
+        """
+        if is_mapped_model(path):
+            return cls.__load_mapped(path)
+        model = load_model(path)
+        param = Parameter()
+        for name, value in model['params'].items():
+            setattr(param, name, value)
+        morph_analyzer = cls(param)
+        symbols = SymbolTable.from_symbols(model['symbols'])
+        morph_analyzer.__word_dict = model['word_dict']
+        morph_analyzer.__seg_dict = model['seg_dict']
+        morph_analyzer.__ta = TokenAnalyzer(
+            model['word_dict'],
+            model['suffix_dict'],
+            param.MinStemLen,
+            param.MaxSuffixLen,
+            param.UseTransRules,
+            symbols)
+        morph_analyzer.__probroots = model['probroots']
+        morph_analyzer.__probsuffix = model['probsuffix']
+        morph_analyzer.__probtrans = model['probtrans']
+        return morph_analyzer
+
+    @classmethod
+    def __load_mapped(cls, path):
+        """Create an analyzer whose model is a MappedModel of the file at `path`."""
+        model = MappedModel(path)
+        param = Parameter()
+        for name, value in model.params.items():
+            setattr(param, name, value)
+        morph_analyzer = cls(param)
+        morph_analyzer.__mapped_path = path
+        morph_analyzer.__attach_mapped(model)
+        return morph_analyzer
+
+    def __attach_mapped(self, model):
+        """Use the dictionaries of a MappedModel as the trained model."""
+        param = self.param
+        rule_index = LazyTransRuleIndex(model.word_dict, model.morph_dict, param.MinStemLen, param.MaxSuffixLen)
+        self.__word_dict = model.word_dict
+        self.__seg_dict = model.seg_dict
+        self.__ta = TokenAnalyzer(
+            model.word_dict,
+            model.suffix_dict,
+            param.MinStemLen,
+            param.MaxSuffixLen,
+            param.UseTransRules,
+            model.symbols,
+            rule_index)
+        self.__probroots = model.probroots
+        self.__probsuffix = model.probsuffix
+        self.__probtrans = model.probtrans
+
+    def __getstate__(self):
+        """Pickle the analyzer, leaving out the dictionaries of a mapped model, which can't be pickled, and what's kept
+        for update."""
+        state = self.__dict__.copy()
+        # the state kept for update isn't needed to segment
+        for name in ('prior_counts', 'resolved_segs', 'paradigm_state', 'sorted_words'):
+            state['_MorphAnalyzer__' + name] = None
+        if self.__mapped_path is not None:
+            for name in ('word_dict', 'seg_dict', 'ta', 'probroots', 'probsuffix', 'probtrans'):
+                state['_MorphAnalyzer__' + name] = None
+        return state
+
+    def __setstate__(self, state):
+        """Unpickle the analyzer, mapping the file of a mapped model again."""
+        self.__dict__.update(state)
+        if self.__mapped_path is not None:
+            self.__attach_mapped(MappedModel(self.__mapped_path))
 
     def segment_token(self, token):
         """Use the currently trained model to segment the token."""
@@ -352,9 +692,131 @@ class MorphAnalyzer():
             self.__probsuffix,
             self.__probtrans)
 
-    def segment_token_list(self, token_list):
-        """Apply segment_token to each token in the list."""
+    def fingerprint(self):
+        """Return a digest identifying the trained model: its parameters (other than those in PERFORMANCE_PARAMETERS)
+        and contents, or the file of a mapped model."""
+        if self.__fingerprint is None:
+            if self.__mapped_path is not None:
+                self.__fingerprint = file_fingerprint(self.__mapped_path)
+            else:
+                self.__fingerprint = model_fingerprint(self.__get_model())
+        return self.__fingerprint
+
+    def oov_cache_stats(self):
+        """Return the hit, miss, and eviction counts and the sizes of the cache of out-of-vocabulary segmentations."""
+        return self.__oov_cache.stats()
+
+    def segment_token_list(self, token_list, num_workers=1, chunk_size=None):
+        """Apply segment_token to each token in the list.
+
+        If `num_workers` is greater than 1, chunks of `chunk_size` tokens (self.param.SegmentChunkSize by default) are
+        segmented in that many worker processes, each of which gets the model once (by fork inheritance, or by mapping
+        the file of a mapped model again). The results are the same as the serial ones, in the same order.
+
+        If self.param.OOVCachePath is set, the segmentations of tokens that aren't in the segmentation dictionary are
+        looked up in the persistent cache in that file (see caches.PersistentSegCache) before they're analyzed, and
+        added to it afterwards, a batch of self.param.OOVCacheBatchSize tokens at a time.
+        """
+        if chunk_size is None:
+            chunk_size = self.param.SegmentChunkSize
+        if num_workers > 1:
+            with worker_pool(self, num_workers) as pool:
+                return self.__segment_token_list(token_list, pool, num_workers, chunk_size)
+        return self.__segment_token_list(token_list, None, num_workers, chunk_size)
+
+    def segment_token_batches(self, tokens, batch_size=None, num_workers=1, chunk_size=None):
+        """Segment the tokens of an iterable, `batch_size` (self.param.SegmentBatchSize by default) at a time.
+
+        Yields each batch (a list of tokens) with the list of their segmentations, as segment_token_list returns it.
+        Tokens are read from `tokens` only as each batch is needed, so only one batch and its segmentations are held in
+        memory at once, and the worker processes, if `num_workers` is greater than 1, are started once for all batches.
+        """
+        if batch_size is None:
+            batch_size = self.param.SegmentBatchSize
+        if chunk_size is None:
+            chunk_size = self.param.SegmentChunkSize
+        token_iter = iter(tokens)
+        with self.__open_pool(num_workers) as pool:
+            for batch in iter(lambda: list(islice(token_iter, batch_size)), []):
+                yield batch, self.__segment_token_list(batch, pool, num_workers, chunk_size)
+
+    def segment_corpus(self, lines, batch_size=None, num_workers=1, chunk_size=None):
+        """Segment tokenized text, given as an iterable of lines of whitespace-separated tokens.
+
+        Yields the list of tokens of each line with the list of their segmentations, in order. Lines are read until
+        they hold `batch_size` tokens (self.param.SegmentBatchSize by default), and each distinct type of the batch is
+        segmented once (in worker processes if `num_workers` is greater than 1, as in segment_token_list); its tokens
+        are then mapped back to their segmentations through the table of types.
+        """
+        if batch_size is None:
+            batch_size = self.param.SegmentBatchSize
+        if chunk_size is None:
+            chunk_size = self.param.SegmentChunkSize
+        line_iter = iter(lines)
+        with self.__open_pool(num_workers) as pool:
+            while True:
+                batch_lines = []
+                num_tokens = 0
+                type_ids = {}  # the index of each distinct type of the batch
+                for line in line_iter:
+                    tokens = line.split()
+                    batch_lines.append(tokens)
+                    for token in tokens:
+                        type_ids.setdefault(token, len(type_ids))
+                    num_tokens += len(tokens)
+                    if num_tokens >= batch_size:
+                        break
+                if not batch_lines:
+                    return
+                type_segs = self.__segment_token_list(list(type_ids), pool, num_workers, chunk_size)
+                for tokens in batch_lines:
+                    yield tokens, [type_segs[type_ids[token]] for token in tokens]
+
+    def __open_pool(self, num_workers):
+        """Return a context giving a worker_pool of `num_workers` processes, or None if `num_workers` is 1."""
+        if num_workers > 1:
+            return worker_pool(self, num_workers)
+        return nullcontext()
+
+    def __segment_token_list(self, token_list, pool, num_workers, chunk_size):
+        """Segment the tokens, using the persistent cache if self.param.OOVCachePath is set."""
+        if self.param.OOVCachePath:
+            return self.__segment_token_list_cached(token_list, pool, num_workers, chunk_size)
+        return self.__segment_token_list_uncached(token_list, pool, num_workers, chunk_size)
+
+    def __segment_token_list_uncached(self, token_list, pool, num_workers, chunk_size):
+        """Apply segment_token to each token in the list, in this process or in chunks in the pool (of `num_workers`
+        processes) if it's given, with a bounded window of chunks in flight (see workers.imap_bounded)."""
         token_seg_list = []
-        for token in token_list:
-            token_seg_list.append(self.segment_token(token))
+        if pool is None:
+            for token in token_list:
+                token_seg_list.append(self.segment_token(token))
+            return token_seg_list
+        token_iter = iter(token_list)
+        chunks = iter(lambda: list(islice(token_iter, chunk_size)), [])
+        for chunk_segs in imap_bounded(pool, _segment_chunk, chunks, num_workers):
+            token_seg_list.extend(chunk_segs)
         return token_seg_list
+
+    def __segment_token_list_cached(self, token_list, pool, num_workers, chunk_size):
+        """Apply segment_token to each token in the list, using the persistent cache of self.param.OOVCachePath."""
+        token_seg_list = []
+        token_iter = iter(token_list)
+        with PersistentSegCache(self.param.OOVCachePath, self.fingerprint(), self.param.OOVCacheMaxAge) as cache:
+            for batch in iter(lambda: list(islice(token_iter, self.param.OOVCacheBatchSize)), []):
+                # look up the distinct unknown tokens of the batch at once
+                oov_tokens = dict.fromkeys(token for token in batch if token not in self.__seg_dict)
+                batch_segs = cache.get_many(oov_tokens)
+                # segment the distinct tokens that weren't found
+                new_tokens = list(dict.fromkeys(token for token in batch if token not in batch_segs))
+                new_segs = self.__segment_token_list_uncached(new_tokens, pool, num_workers, chunk_size)
+                batch_segs.update(zip(new_tokens, new_segs))
+                token_seg_list.extend(batch_segs[token] for token in batch)
+                cache.put_many((token, seg) for token, seg in zip(new_tokens, new_segs) if token in oov_tokens)
+        return token_seg_list
+
+
+def _segment_chunk(token_chunk):
+    """Segment a chunk of tokens in a worker process, with the analyzer shared by worker_pool."""
+    morph_analyzer = get_shared()
+    return [morph_analyzer.segment_token(token) for token in token_chunk]
@@ -5,23 +5,22 @@ Created on Jun 11, 2018
 '''
 
 
+import numpy as np
 from reliableroot import is_reliable_root
+from symbols import NULL_ID, popcount
 
 
 def create_paradigms(token_structs):
-    """Create a dictionary of paradigms (maps from roots to their possible affixated forms).
+    """Create a dictionary of paradigms (maps from roots to their possible affixated forms) from the segmentations in
+    `token_structs` (a CandidateLattice).
 
-    Also collect a dictionary of atomic words.
+    Roots, transformations, and suffixes in the paradigms are symbol ids from the lattice. Also collect a dictionary of
+    atomic words.
     """
     atomic_word_dict = {}
     paradigm_dict = {}
-    for ts in token_structs:
-        suffix = ts.suffix
-        morph = ts.morph
-        word = ts.token
-        root = ts.root
-        trans = ts.trans
-        if suffix == '$':  # this is an atomic word
+    for word, morph, root, trans, suffix in token_structs.iter_candidate_ids():
+        if suffix == NULL_ID:  # this is an atomic word
             atomic_word_dict[word] = ((word,), ((word, '$', '$'),))
             continue
         # this is a morphologically complex word
@@ -31,57 +30,178 @@ def create_paradigms(token_structs):
     return paradigm_dict, atomic_word_dict
 
 
-def get_paradigm_suffix_sets(paradigm_dict):
-    """For each root, collect the set of possible suffixes."""
+class ParadigmMatrix():
+    """A sparse (root x suffix) matrix of paradigms, an alternative to the paradigm dictionary of create_paradigms.
+
+    Entry `k` says that the word `words[k]` (with morph `morphs[k]`) derives from the root of row `rows[k]` through the
+    transformation `trans_ids[k]` and the suffix of column `cols[k]`. Rows map to root ids through `root_ids`, in the
+    order create_paradigms adds the roots, and columns map to suffix ids through `suffix_ids`, sorted by id. Statistics
+    over suffixes are column sums over the entries rather than loops over the paradigms.
+    """
+
+    def __init__(self, root_ids, rows, suffix_ids, cols, trans_ids, words, morphs):
+        """Save the entries and the ids of the rows and columns (see above)."""
+        self.root_ids = root_ids
+        self.rows = rows
+        self.suffix_ids = suffix_ids
+        self.cols = cols
+        self.trans_ids = trans_ids
+        self.words = words
+        self.morphs = morphs
+
+    @classmethod
+    def from_lattice(cls, token_structs):
+        """Create the matrix of the segmentations in `token_structs` (a CandidateLattice), and collect a dictionary of
+        atomic words, as create_paradigms does."""
+        offsets = np.array(token_structs.offsets, dtype=np.int64)
+        token_ids = np.repeat(np.arange(len(token_structs), dtype=np.int64), np.diff(offsets))
+        suffix_ids = np.array(token_structs.suffix_ids, dtype=np.int64)
+        tokens = token_structs.tokens
+
+        atomic_word_dict = {}
+        atomic = suffix_ids == NULL_ID
+        for token_id in token_ids[atomic].tolist():
+            word = tokens[token_id]
+            atomic_word_dict[word] = ((word,), ((word, '$', '$'),))
+
+        # number the roots in the order they're first seen
+        entries = np.flatnonzero(~atomic)
+        root_ids, first_entries, root_inverse = np.unique(np.array(token_structs.root_ids, dtype=np.int64)[entries],
+                                                          return_index=True, return_inverse=True)
+        row_order = np.argsort(first_entries, kind='stable')
+        row_ranks = np.empty(len(row_order), dtype=np.int64)
+        row_ranks[row_order] = np.arange(len(row_order))
+        col_suffix_ids, cols = np.unique(suffix_ids[entries], return_inverse=True)
+        words = [tokens[token_id] for token_id in token_ids[entries].tolist()]
+        morph_lens = np.array(token_structs.morph_lens, dtype=np.int64)[entries].tolist()
+        paradigm_matrix = cls(root_ids[row_order], row_ranks[root_inverse.ravel()], col_suffix_ids, cols.ravel(),
+                              np.array(token_structs.trans_ids, dtype=np.int64)[entries], words,
+                              [word[:morph_len] for word, morph_len in zip(words, morph_lens)])
+        return paradigm_matrix, atomic_word_dict
+
+    @property
+    def shape(self):
+        return len(self.root_ids), len(self.suffix_ids)
+
+    def select(self, entries):
+        """Create a matrix with only the given entries (a boolean mask or indices), keeping the rows and columns."""
+        entries = np.flatnonzero(entries) if np.asarray(entries).dtype == bool else np.asarray(entries, dtype=np.int64)
+        return ParadigmMatrix(self.root_ids, self.rows[entries], self.suffix_ids, self.cols[entries],
+                              self.trans_ids[entries], [self.words[k] for k in entries.tolist()],
+                              [self.morphs[k] for k in entries.tolist()])
+
+    def suffix_word_freqs(self):
+        """Return the number of derived words of each suffix (column)."""
+        return np.bincount(self.cols, minlength=self.shape[1])
+
+    def suffix_root_freqs(self):
+        """Return the number of roots (paradigms) each suffix (column) occurs in, i.e. its paradigm support."""
+        cells = np.unique(self.rows * self.shape[1] + self.cols)
+        return np.bincount(cells % max(1, self.shape[1]), minlength=self.shape[1])
+
+    def filter_rare_suffixes(self, min_freq):
+        """Remove the suffixes that occur in fewer than `min_freq` roots from all paradigms (see
+        filter_rare_suffix_from_suffix_set)."""
+        return self.select(self.suffix_root_freqs()[self.cols] >= min_freq)
+
+    def root_len_matrix(self, symbols):
+        """Count the derived words of each suffix by the length of their root.
+
+        Returns the smallest and largest root lengths of the paradigms and a dense (suffix x root length) count matrix,
+        where column `i` holds the counts for root length `min_root_len + i`.
+        """
+        root_lens = np.array([len(symbols[root]) for root in self.root_ids.tolist()], dtype=np.int64)
+        entry_root_lens = root_lens[self.rows]
+        if not len(entry_root_lens):
+            return 0, -1, np.zeros((self.shape[1], 0))
+        min_root_len, max_root_len = int(entry_root_lens.min()), int(entry_root_lens.max())
+        width = max_root_len - min_root_len + 1
+        cells = self.cols * width + (entry_root_lens - min_root_len)
+        counts = np.bincount(cells, minlength=self.shape[1] * width)
+        return min_root_len, max_root_len, counts.reshape(self.shape[1], width).astype(float)
+
+    def root_suffix_sets(self, suffix_bits):
+        """For each root with any entries, collect its suffixes as a bitmask over positions from `suffix_bits` (see
+        get_paradigm_suffix_sets)."""
+        suffix_sets = {}
+        suffix_ids = self.suffix_ids.tolist()
+        for row, col in zip(self.rows.tolist(), self.cols.tolist()):
+            suffix_sets[row] = suffix_sets.get(row, 0) | suffix_bits.bit(suffix_ids[col])
+        root_ids = self.root_ids.tolist()
+        return [(root_ids[row], suffix_set) for row, suffix_set in sorted(suffix_sets.items())]
+
+    def to_paradigm_dict(self):
+        """Export the matrix to the paradigm dictionary form of create_paradigms (for pruning and
+        get_seg_dict_by_paradigms), leaving out empty rows."""
+        paradigm_dict = {}
+        root_ids = self.root_ids.tolist()
+        suffix_ids = self.suffix_ids.tolist()
+        order = np.argsort(self.rows, kind='stable').tolist()
+        rows, cols, trans_ids = self.rows.tolist(), self.cols.tolist(), self.trans_ids.tolist()
+        for k in order:
+            root = root_ids[rows[k]]
+            derived_word = (self.words[k], trans_ids[k], suffix_ids[cols[k]], self.morphs[k])
+            if root in paradigm_dict:
+                paradigm_dict[root].append(derived_word)
+            else: paradigm_dict[root] = [derived_word]
+        return paradigm_dict
+
+
+def get_paradigm_suffix_sets(paradigm_dict, suffix_bits):
+    """For each root, collect the set of possible suffixes, as a bitmask over positions from `suffix_bits`."""
     root_suffix_tuple_list = []
     for root, derived_word_list in paradigm_dict.items():
-        suffix_set = set([x[2] for x in derived_word_list])  # suffixes are the second element; see create_paradigms
+        suffix_set = suffix_bits.mask([x[2] for x in derived_word_list])  # suffixes are the third element
         root_suffix_tuple_list.append((root, suffix_set))
     return root_suffix_tuple_list
 
 
-def filter_rare_suffix_from_suffix_set(root_suffix_set_list, min_freq):
-    """Find suffixes that occur with frequency less than `min_freq`, and remove them from all paradigms."""
-    # collect the number of occurrences of each suffix
-    suffix_dict = {}
+def filter_rare_suffix_from_suffix_set(root_suffix_set_list, min_freq, suffix_bits):
+    """Find suffixes that occur with frequency less than `min_freq`, and remove them from all paradigms.
+
+    Suffix sets are bitmasks over positions from `suffix_bits`.
+    """
+    # collect the number of occurrences of each suffix, decoding each distinct suffix set only once
+    suffix_set_freq = {}
     for root, suffix_set in root_suffix_set_list:
-        for suffix in suffix_set:
+        if suffix_set in suffix_set_freq:
+            suffix_set_freq[suffix_set] += 1
+        else: suffix_set_freq[suffix_set] = 1
+    suffix_dict = {}
+    for suffix_set, set_freq in suffix_set_freq.items():
+        for suffix in suffix_bits.members(suffix_set):
             if suffix in suffix_dict:
-                suffix_dict[suffix] += 1
-            else: suffix_dict[suffix] = 1
+                suffix_dict[suffix] += set_freq
+            else: suffix_dict[suffix] = set_freq
 
-    # filter the suffixes with frequency less than `min_freq`
-    filtered_suffix_dict = {}
-    for suffix, freq in suffix_dict.items():
-        if freq < min_freq:
-            continue
-        filtered_suffix_dict[suffix] = freq
+    # the mask of the suffixes with frequency at least `min_freq`
+    frequent_mask = suffix_bits.mask([suffix for suffix, freq in suffix_dict.items() if freq >= min_freq])
 
     # trim all of the infrequent suffixes from each set
     filtered_root_suffix_set_list = []
     for root, suffix_set in root_suffix_set_list:
-        suffix_list = []
-        for suffix in suffix_set:
-            if suffix in filtered_suffix_dict:
-                suffix_list.append(suffix)
-        if suffix_list:
-            filtered_root_suffix_set_list.append((root, set(suffix_list)))
+        suffix_set &= frequent_mask
+        if suffix_set:
+            filtered_root_suffix_set_list.append((root, suffix_set))
 
     return filtered_root_suffix_set_list
 
 
-def stats_suffix_sets(root_suffix_set_list, word_dict):
-    """Create a map from tuples of suffixes in a paradigm to lists of roots supporting the paradigm, along with their
-    frequencies. Discard roots that are deemed unreliable by is_reliable_root."""
+def stats_suffix_sets(root_suffix_set_list, word_dict, symbols):
+    """Create a map from sets of suffixes in a paradigm to lists of roots supporting the paradigm, along with their
+    frequencies. Discard roots that are deemed unreliable by is_reliable_root.
+
+    Roots are symbol ids from `symbols`; suffix sets are bitmasks, which serve as the keys of the map.
+    """
     suffix_tuple_dict = {}
-    for root, suffix_set in root_suffix_set_list:
+    for root_id, suffix_set in root_suffix_set_list:
+        root = symbols[root_id]
         freq = word_dict[root] if root in word_dict else 1
         if not is_reliable_root(root, freq):
             continue  # ensure we trust the root to be a root
-        suffix_tuple = tuple(sorted(suffix_set))
-        if suffix_tuple in suffix_tuple_dict:
-            suffix_tuple_dict[suffix_tuple].append((root, freq))
-        else: suffix_tuple_dict[suffix_tuple] = [(root, freq)]
+        if suffix_set in suffix_tuple_dict:
+            suffix_tuple_dict[suffix_set].append((root_id, freq))
+        else: suffix_tuple_dict[suffix_set] = [(root_id, freq)]
     return suffix_tuple_dict
 
 
@@ -93,46 +213,43 @@ def filter_suffix_tuple(suffix_tuple_dict, min_support, min_tuple_size):
     """
     filtered_suffix_tuple_dict = {}
     for suffix_tuple, root_list in suffix_tuple_dict.items():
-        tuple_size = len(suffix_tuple)
+        tuple_size = popcount(suffix_tuple)
         if tuple_size < min_tuple_size:
             continue  # robustness requirement
         support = len(root_list)
         if support < min_support:
             continue  # productivity requirement
-        long_suffix_count = 0
-        for suffix in suffix_tuple:
-            if len(suffix) > 1:
-                long_suffix_count += 1
         filtered_suffix_tuple_dict[suffix_tuple] = root_list
     return filtered_suffix_tuple_dict
 
 
-def stats_single_suffix_type_freq(suffix_tuple_dict):
+def stats_single_suffix_type_freq(suffix_tuple_dict, suffix_bits):
     """Collect a frequency dictionary for suffixes, where the frequency is the number of words the suffix applies to."""
     suffix_dict = {}
     for suffix_tuple, root_list in suffix_tuple_dict.items():
         freq = len(root_list)
-        for suffix in suffix_tuple:
+        for suffix in suffix_bits.members(suffix_tuple):
             if suffix in suffix_dict:
                 suffix_dict[suffix] += freq
             else: suffix_dict[suffix] = freq
     return suffix_dict
 
 
-def get_single_suffix_tuples(suffix_type_dict, suffix_tuple_dict):
+def get_single_suffix_tuples(suffix_type_dict, suffix_tuple_dict, suffix_bits):
     """Get just the paradigms with a single suffix."""
     valid_singleton_dict = {}
     for suffix_tuple in suffix_tuple_dict:
-        if len(suffix_tuple) != 1:
+        if popcount(suffix_tuple) != 1:
             continue
-        suffix = suffix_tuple[0]
+        suffix = suffix_bits.members(suffix_tuple)[0]
         if not suffix in suffix_type_dict:
             continue
         valid_singleton_dict[suffix_tuple] = suffix_tuple_dict[suffix_tuple]
     return valid_singleton_dict
 
 
-def get_reliable_suffix_tuples(root_suffix_set_list, word_dict, min_support, min_tuple_size, min_suffix_freq):
+def get_reliable_suffix_tuples(root_suffix_set_list, word_dict, min_support, min_tuple_size, min_suffix_freq, symbols,
+                               suffix_bits):
     """Gets suffix tuples (sets of suffixes of a particular paradigm) where the requirements for reliability are met.
 
     Specifically, reliability requires:
@@ -140,22 +257,27 @@ def get_reliable_suffix_tuples(root_suffix_set_list, word_dict, min_support, min
         2. that the number of suffixes in the paradigm be greater than or equal to `min_tuple_size` (robustness)
         3. that the suffix frequency be greater than or equal to `min_suffix_freq` (frequency)
 
+    Roots and suffixes are symbol ids from `symbols`, and suffix tuples are bitmasks over positions from `suffix_bits`.
+    If `min_suffix_freq` is None, the rare suffixes are taken to be filtered out already (as by
+    ParadigmMatrix.filter_rare_suffixes).
+
     Returns:
         (dict): the filtered suffix tuple dict
         (dict): just the paradigms with a single suffix
         (dict): the productivity of each suffix.
     """
     # filter for frequency
-    root_suffix_set_list = filter_rare_suffix_from_suffix_set(root_suffix_set_list, min_suffix_freq)
+    if min_suffix_freq is not None:
+        root_suffix_set_list = filter_rare_suffix_from_suffix_set(root_suffix_set_list, min_suffix_freq, suffix_bits)
 
     # get the suffix tuples along with the roots they modify
-    suffix_tuple_dict = stats_suffix_sets(root_suffix_set_list, word_dict)
+    suffix_tuple_dict = stats_suffix_sets(root_suffix_set_list, word_dict, symbols)
 
     # filter for robustness and productivity
     filtered_suffix_tuple_dict = filter_suffix_tuple(suffix_tuple_dict, min_support, min_tuple_size)
 
     # get the paradigms with a single suffix
-    suffix_type_dict = stats_single_suffix_type_freq(filtered_suffix_tuple_dict)
-    single_suffix_tuple_dict = get_single_suffix_tuples(suffix_type_dict, suffix_tuple_dict)
+    suffix_type_dict = stats_single_suffix_type_freq(filtered_suffix_tuple_dict, suffix_bits)
+    single_suffix_tuple_dict = get_single_suffix_tuples(suffix_type_dict, suffix_tuple_dict, suffix_bits)
 
     return filtered_suffix_tuple_dict, single_suffix_tuple_dict, suffix_type_dict
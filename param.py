@@ -5,6 +5,13 @@ Created on Jun 11, 2018
 '''
 
 
+# parameters that only affect speed and memory use, not the model or its segmentations; they're left out of saved
+# models and model fingerprints
+PERFORMANCE_PARAMETERS = ('NumWorkers', 'StreamCandidates', 'StreamBatchSize', 'ParadigmMatrix', 'OOVCacheSize',
+                          'OOVCachePath', 'OOVCacheBatchSize', 'OOVCacheMaxAge', 'SegmentChunkSize',
+                          'SegmentBatchSize')
+
+
 class Parameter():
     """Class containing parameters to be passed to the experiment function."""
 
@@ -27,6 +34,27 @@ class Parameter():
         self.MinSuffixFreq = 3
         self.MinParadigmSupport = 2
         self.MinParadigmSuffix = 2
+        self.BootstrapIterations = 2  # iterations used to find reliable suffixes (at least 1)
+
+        # Hard EM re-estimation after the final segmentation of training (not used with StreamCandidates). Bootstrapping
+        # doesn't run it, so its suffix probabilities are kept; EM starts from them, and then re-estimates the root,
+        # suffix, and transition probabilities from the counts of the best segmentations
+        self.EMIterations = 0  # the maximum number of iterations; 0 keeps the single pass from the paper
+        self.EMMinChange = 0.0  # stop once no more than this fraction of the segmentations change
+
+        # Performance Parameters
+        self.NumWorkers = 1
+        self.StreamCandidates = False  # generate candidates in two passes instead of holding them all
+        self.StreamBatchSize = 100000
+        self.ParadigmMatrix = False  # build paradigms as a sparse (root x suffix) matrix, suffix stats as column sums
+        self.OOVCacheSize = 100000  # the number of out-of-vocabulary segmentations to cache; 0 disables the cache
+        self.OOVCachePath = None  # an SQLite file caching out-of-vocabulary segmentations across runs, if set
+        self.OOVCacheBatchSize = 10000  # the number of tokens looked up in the OOVCachePath cache at once
+        # the cached segmentations of models that haven't used the OOVCachePath file for this many days are removed
+        # when it's opened; 0 keeps them
+        self.OOVCacheMaxAge = 7
+        self.SegmentChunkSize = 10000  # the number of tokens sent to a worker at once when segmenting in parallel
+        self.SegmentBatchSize = 100000  # the number of tokens held in memory at once when streaming segmentations
 
     def print_all(self):
         """Print the contents of all parameters."""
@@ -39,4 +67,12 @@ class Parameter():
         print('MaxSuffixLen: %s' % self.MaxSuffixLen)
         print('DoHyphen: %s' % self.DoHyphen)
         print('DoApostrophe: %s' % self.DoApostrophe)
+        print('BootstrapIterations: %s' % self.BootstrapIterations)
+        print('EMIterations: %s' % self.EMIterations)
+        print('NumWorkers: %s' % self.NumWorkers)
+        print('StreamCandidates: %s' % self.StreamCandidates)
+        print('ParadigmMatrix: %s' % self.ParadigmMatrix)
+        print('OOVCacheSize: %s' % self.OOVCacheSize)
+        print('OOVCachePath: %s' % self.OOVCachePath)
+        print('OOVCacheMaxAge: %s' % self.OOVCacheMaxAge)
         print('-------------------------------------')
@@ -5,70 +5,103 @@ Created on Jun 11, 2018
 '''
 
 
+import heapq
 from tqdm import tqdm
 from reliableroot import is_reliable_root
+from symbols import popcount
 
 
-def get_suffix_type_score(suffix_tuples):
+def get_suffix_type_score(suffix_tuples, suffix_bits):
     """Get the total number of roots where each suffix can apply."""
     suffix_type_dict = {}
     for suffix_tuple, root_list in suffix_tuples.items():
-        for suffix in suffix_tuple:
+        for suffix in suffix_bits.members(suffix_tuple):
             if suffix in suffix_type_dict:
                 suffix_type_dict[suffix] += len(root_list)
             else: suffix_type_dict[suffix] = len(root_list)
     return suffix_type_dict
 
 
-def prune_suffix_tuple(suffix_tuple, suffix_tuple_dict, suffix_type_score):
-    """Prunes unlikely suffixes from suffix_tuple.
-
-    Keeps known sets of suffixes, or if the suffix_tuple is unknown, returns a combination of the three top-scoring
-    known paradigms containing suffixes from suffix_tuple."""
-    # if suffix_tuple is a known suffix tuple, keep it.
-    if suffix_tuple in suffix_tuple_dict:
-        return suffix_tuple
-
-    # if suffix_tuple only has one element, prune the whole paradigm.
-    if len(suffix_tuple) == 1:
-        return tuple()
-
-    # get the list of known suffix sets containing suffixes from our suffix_tuple
-    satisfied_tuples = []
-    suffix_set = set(suffix_tuple)
-    for suffix_tuple in suffix_tuple_dict:
-        satisfied_suffix = []
-        for suffix in suffix_tuple:
-            if suffix in suffix_set:
-                satisfied_suffix.append(suffix)
-        if not satisfied_suffix:
-            continue
-        satisfied_tuples.append(satisfied_suffix)
-
-    # if there are no known suffixes in suffix_tuple, prune the whole paradigm.
-    if not satisfied_tuples:
-        return tuple()
+class SuffixTuplePruner():
+    """Prunes unlikely suffixes from suffix tuples, given the known (reliable) suffix tuples and the suffix scores.
 
-    # collect the scores of each known suffix from the paradigms
-    suffix_tuple_score = []
-    for suffix_list in satisfied_tuples:
-        score = 0
-        for suffix in suffix_list:
-            score += suffix_type_score[suffix]
-        suffix_tuple_score.append((suffix_list, score))
+    Suffix tuples are bitmasks over positions from `suffix_bits`. An inverted index from each suffix to the known tuples
+    containing it means only the relevant known tuples are looked at, and results are memoized by suffix tuple, since
+    many roots share the same one.
+    """
 
-    # return the set of known suffixes from the top three scoring suffix tuples
-    sorted_suffix_tuple_score = sorted(suffix_tuple_score, key=lambda x: -x[1])
-    e_indx = min(3, len(sorted_suffix_tuple_score))
-    suffix_tuple_final = []
-    for i in range(e_indx):
-        suffix_tuple_final.extend(sorted_suffix_tuple_score[i][0])
-    return tuple(sorted(set(suffix_tuple_final)))
+    def __init__(self, suffix_tuple_dict, suffix_type_score, suffix_bits):
+        """Index the known suffix tuples."""
+        self.suffix_tuple_dict = suffix_tuple_dict
+        self.suffix_type_score = suffix_type_score
+        self.suffix_bits = suffix_bits
+        self.known_tuples = list(suffix_tuple_dict)
+        # map each suffix to the positions (in self.known_tuples) of the known tuples containing it
+        self.suffix_index = {}
+        for position, known_tuple in enumerate(self.known_tuples):
+            for suffix in suffix_bits.members(known_tuple):
+                if suffix in self.suffix_index:
+                    self.suffix_index[suffix].append(position)
+                else: self.suffix_index[suffix] = [position]
+        self.memo = {}
+
+    def prune(self, suffix_tuple):
+        """Prunes unlikely suffixes from suffix_tuple.
+
+        Keeps known sets of suffixes, or if the suffix_tuple is unknown, returns a combination of the three top-scoring
+        known paradigms containing suffixes from suffix_tuple."""
+        if suffix_tuple in self.memo:
+            return self.memo[suffix_tuple]
+        pruned_tuple = self.__prune(suffix_tuple)
+        self.memo[suffix_tuple] = pruned_tuple
+        return pruned_tuple
+
+    def __prune(self, suffix_tuple):
+        """Prune suffix_tuple without looking at the memo."""
+        # if suffix_tuple is a known suffix tuple, keep it.
+        if suffix_tuple in self.suffix_tuple_dict:
+            return suffix_tuple
+
+        # if suffix_tuple only has one element, prune the whole paradigm.
+        if popcount(suffix_tuple) == 1:
+            return 0
+
+        # get the known suffix tuples containing suffixes from our suffix_tuple, in their original order
+        positions = set()
+        for suffix in self.suffix_bits.members(suffix_tuple):
+            positions.update(self.suffix_index.get(suffix, ()))
+
+        # if there are no known suffixes in suffix_tuple, prune the whole paradigm.
+        if not positions:
+            return 0
+
+        # collect the scores of each known suffix from the paradigms
+        suffix_tuple_score = []
+        for position in sorted(positions):
+            satisfied_suffix = self.known_tuples[position] & suffix_tuple
+            score = 0
+            for suffix in self.suffix_bits.members(satisfied_suffix):
+                score += self.suffix_type_score[suffix]
+            suffix_tuple_score.append((satisfied_suffix, score))
+
+        # return the set of known suffixes from the top three scoring suffix tuples (ties go to the earlier tuple)
+        suffix_tuple_final = 0
+        for satisfied_suffix, _score in heapq.nsmallest(3, suffix_tuple_score, key=lambda x: -x[1]):
+            suffix_tuple_final |= satisfied_suffix
+        return suffix_tuple_final
+
+
+def prune_suffix_tuple(suffix_tuple, suffix_tuple_dict, suffix_type_score, suffix_bits):
+    """Prunes unlikely suffixes from suffix_tuple (see SuffixTuplePruner.prune).
+
+    To prune many suffix tuples against the same known tuples, use a single SuffixTuplePruner instead."""
+    return SuffixTuplePruner(suffix_tuple_dict, suffix_type_score, suffix_bits).prune(suffix_tuple)
 
 
 def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, single_suffix_tuples, word_dict,
-                    exclude_unreliable):
-    """Prune paradigms based on specified conditions.
+                    exclude_unreliable, symbols, suffix_bits):
+    """Prune paradigms based on specified conditions. Roots and suffixes are symbol ids from `symbols`, and suffix
+    tuples are bitmasks over positions from `suffix_bits`.
 
     Conditions to prune include:
         1. The word isn't in the list of known words.
@@ -78,9 +111,10 @@ def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, si
     pruned_paradigm_dict = {}  # to stored paradigms that survive pruning
     root_suffix_set_dict = {}  # to store roots with their suffix set if they survive pruning
     pruned_words = []  # the "garbage can" of pruned words
-    for word, derived_word_list in tqdm(paradigm_dict.items()):
-        suffix_set = set([x[2] for x in derived_word_list])
-        suffix_tuple = tuple(sorted(suffix_set))
+    suffix_tuple_pruner = SuffixTuplePruner(reliable_suffix_tuples, suffix_type_score, suffix_bits)
+    for root_id, derived_word_list in tqdm(paradigm_dict.items()):
+        word = symbols[root_id]
+        suffix_tuple = suffix_bits.mask([x[2] for x in derived_word_list])
 
         # if the word isn't in the known list of words,
         if not word in word_dict:
@@ -99,12 +133,12 @@ def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, si
                 pruned_word, root, suffix = x[0], word, x[2]
                 pruned_words.append((pruned_word, root, suffix))
             continue
-        if len(suffix_tuple) == 1:  # if this paradigm only has one suffix,
+        if popcount(suffix_tuple) == 1:  # if this paradigm only has one suffix,
             # and if this paradigm was found in single_suffix_tuples and the root is unreliable,
             if suffix_tuple in single_suffix_tuples and ((not exclude_unreliable) or root_unreliable):
                 # keep it.
-                pruned_paradigm_dict[word] = derived_word_list.copy()
-                root_suffix_set_dict[word] = suffix_set
+                pruned_paradigm_dict[root_id] = derived_word_list.copy()
+                root_suffix_set_dict[root_id] = suffix_tuple
                 continue
             # Otherwise, prune it.
             # get the only possible derived word (since there's only one suffix to add)
@@ -113,8 +147,7 @@ def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, si
             continue
 
         # prune unlikely suffixes
-        rem_tuple = prune_suffix_tuple(suffix_tuple, reliable_suffix_tuples, suffix_type_score)
-        rem_set = set(rem_tuple)
+        rem_set = suffix_tuple_pruner.prune(suffix_tuple)
         # if there were no likely suffixes in the set,
         if not rem_set:
             # prune it.
@@ -126,7 +159,7 @@ def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, si
         # Otherwise, some suffixes were likely. Create a new derived_word_list using only the pruned suffixes.
         derived_word_list_1 = []
         for derived_word, trans, suffix, morph in derived_word_list:
-            if suffix in rem_set:  # If the suffix was likely,
+            if suffix_bits.bit(suffix) & rem_set:  # If the suffix was likely,
                 # add it.
                 derived_word_list_1.append((derived_word, trans, suffix, morph))
                 continue
@@ -135,7 +168,7 @@ def prune_paradigms(paradigm_dict, reliable_suffix_tuples, suffix_type_score, si
 
         if derived_word_list_1:
             # record the transformations that survived,
-            pruned_paradigm_dict[word] = derived_word_list_1
+            pruned_paradigm_dict[root_id] = derived_word_list_1
             # as well as the set of likely suffixes.
-            root_suffix_set_dict[word] = rem_set
+            root_suffix_set_dict[root_id] = rem_set
     return pruned_paradigm_dict
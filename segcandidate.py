@@ -5,9 +5,19 @@ Created on Jun 11, 2018
 '''
 
 
+from abc import ABC, abstractmethod
+from array import array
+from itertools import islice
+from bayesian import feature
+from symbols import SymbolTable
+from workers import worker_pool, get_shared, split_list, imap_bounded
+
+
 class SegStructure():
     """A class for storing an analysis of a certain token."""
 
+    __slots__ = ('token', 'root', 'morph', 'trans', 'suffix')
+
     def __init__(self, token, morph, root, trans, suffix):
         """Save parameters."""
         self.token = token
@@ -15,27 +25,293 @@ class SegStructure():
         self.morph = morph
         self.trans = trans
         self.suffix = suffix
-        self.key = (root, trans, suffix)  # the triple described in the paper
+
+    @property
+    def key(self):
+        """The triple described in the paper."""
+        return (self.root, self.trans, self.suffix)
 
     def is_atomic(self):
         """Determine whether the word is atomic, as defined in section 3 of the paper."""
         return self.token == self.root
 
 
+class CandidateLattice():
+    """A compact store of the candidate segmentations of a list of tokens.
+
+    Candidates are kept in parallel arrays of root, transformation, suffix, and feature ids (interned in `symbols`) and
+    morph lengths (the morph is always a prefix of the token). The candidates of token `i` are those with indices in
+    `range(offsets[i], offsets[i+1])`. SegStructure views are only created when asked for.
+    """
+
+    def __init__(self, symbols=None):
+        """Create an empty lattice, optionally sharing the symbol table of another one."""
+        self.symbols = SymbolTable() if symbols is None else symbols
+        self.tokens = []  # maps each token id to its token
+        self.offsets = array('l', [0])  # maps each token id to the index of its first candidate
+        self.morph_lens = array('i')
+        self.root_ids = array('i')
+        self.trans_ids = array('i')
+        self.suffix_ids = array('i')
+        self.feat_ids = array('i')  # the feature (see bayesian.feature) of each candidate
+
+    def append(self, token, candidates):
+        """Add a token with its candidates, as given by TokenAnalyzer.get_candidates."""
+        intern = self.symbols.intern
+        self.tokens.append(token)
+        for morph, root, trans, suffix in candidates:
+            self.morph_lens.append(len(morph))
+            self.root_ids.append(intern(root))
+            self.trans_ids.append(intern(trans))
+            self.suffix_ids.append(intern(suffix))
+            self.feat_ids.append(intern(feature(root, suffix)))
+        self.offsets.append(len(self.root_ids))
+
+    def extend(self, other):
+        """Add all of the tokens of another lattice, translating its symbol ids into ours."""
+        base = len(self.root_ids)
+        self.tokens.extend(other.tokens)
+        self.offsets.extend(base + offset for offset in other.offsets[1:])
+        self.morph_lens.extend(other.morph_lens)
+        if other.symbols is self.symbols:
+            self.root_ids.extend(other.root_ids)
+            self.trans_ids.extend(other.trans_ids)
+            self.suffix_ids.extend(other.suffix_ids)
+            self.feat_ids.extend(other.feat_ids)
+            return
+        id_map = [self.symbols.intern(symbol) for symbol in other.symbols.symbols]
+        self.root_ids.extend(id_map[sid] for sid in other.root_ids)
+        self.trans_ids.extend(id_map[sid] for sid in other.trans_ids)
+        self.suffix_ids.extend(id_map[sid] for sid in other.suffix_ids)
+        self.feat_ids.extend(id_map[sid] for sid in other.feat_ids)
+
+    def select(self, indices):
+        """Create a lattice holding one candidate for each token, given by its index in this lattice."""
+        selected = CandidateLattice(self.symbols)
+        selected.tokens = list(self.tokens)
+        selected.offsets = array('l', range(len(indices) + 1))
+        selected.morph_lens = array('i', [self.morph_lens[j] for j in indices])
+        selected.root_ids = array('i', [self.root_ids[j] for j in indices])
+        selected.trans_ids = array('i', [self.trans_ids[j] for j in indices])
+        selected.suffix_ids = array('i', [self.suffix_ids[j] for j in indices])
+        selected.feat_ids = array('i', [self.feat_ids[j] for j in indices])
+        return selected
+
+    def assign(self, token_id, other, j):
+        """Make candidate `j` of another lattice with the same symbol table the candidate of token `token_id`, in a
+        lattice holding one candidate per token (as made by select)."""
+        self.morph_lens[token_id] = other.morph_lens[j]
+        self.root_ids[token_id] = other.root_ids[j]
+        self.trans_ids[token_id] = other.trans_ids[j]
+        self.suffix_ids[token_id] = other.suffix_ids[j]
+        self.feat_ids[token_id] = other.feat_ids[j]
+
+    def view(self, token_id, j):
+        """Create a SegStructure for candidate `j`, which belongs to token `token_id`."""
+        token = self.tokens[token_id]
+        symbols = self.symbols.symbols
+        return SegStructure(token, token[:self.morph_lens[j]], symbols[self.root_ids[j]], symbols[self.trans_ids[j]],
+                            symbols[self.suffix_ids[j]])
+
+    def get_segs(self, token_id):
+        """Create SegStructures for all the candidates of a token."""
+        return [self.view(token_id, j) for j in range(self.offsets[token_id], self.offsets[token_id + 1])]
+
+    def iter_candidate_ids(self):
+        """Iterate over all candidates as (token, morph, root_id, trans_id, suffix_id) tuples."""
+        offsets = self.offsets
+        for token_id, token in enumerate(self.tokens):
+            for j in range(offsets[token_id], offsets[token_id + 1]):
+                yield token, token[:self.morph_lens[j]], self.root_ids[j], self.trans_ids[j], self.suffix_ids[j]
+
+    def __iter__(self):
+        """Iterate over the lists of SegStructures for each token."""
+        for token_id in range(len(self.tokens)):
+            yield self.get_segs(token_id)
+
+    def __len__(self):
+        return len(self.tokens)
+
+
+class SuffixTrie():
+    """A trie over reversed suffixes, used to find every suffix ending a token in a single pass from its end."""
+
+    def __init__(self, suffixes):
+        """Build the trie from an iterable of suffixes."""
+        self.root = {}
+        for suffix in suffixes:
+            if not suffix:
+                continue
+            node = self.root
+            for char in reversed(suffix):
+                if char in node:
+                    node = node[char]
+                else:
+                    child = {}
+                    node[char] = child
+                    node = child
+            node[None] = True  # `None` marks the end of a suffix, since it can't be a character
+
+    def split_points(self, token, s_indx):
+        """Return the indices `indx >= s_indx` where `token[indx:]` is a known suffix, in ascending order."""
+        points = []
+        node = self.root
+        for indx in range(len(token) - 1, s_indx - 1, -1):
+            node = node.get(token[indx])
+            if node is None:
+                break
+            if None in node:
+                points.append(indx)
+        # the walk finds the shortest suffixes first, but candidates are generated from the longest suffix first
+        points.reverse()
+        return points
+
+
+class RuleIndex(ABC):
+    """The transformation rule hypotheses (deletion, replacement, and duplication) of a lexicon, as
+    TokenAnalyzer.get_candidates looks them up.
+
+    Subclasses find the possible roots of a surface morph with get_deletions and get_duplication. Each root comes with
+    the set of suffixes `s` (of length 2 to `max_suffix_len`) for which `root + s` is itself a word, since such a root
+    is blocked for those suffixes.
+    """
+
+    def __init__(self, morph_dict, min_stem_len, max_suffix_len):
+        """Save the morph dictionary of the lexicon (as made by get_morph_dict) and the limits of its analysis."""
+        self.morph_dict = morph_dict
+        self.min_stem_len = min_stem_len
+        self.max_suffix_len = max_suffix_len
+        self.replacement_labels = {}  # maps (root[-1], morph[-1]) to the trans label, filled as needed
+
+    @abstractmethod
+    def get_deletions(self, morph):
+        """Return a tuple of the (root, trans, blocked suffixes) of the roots with morph = root - root[-1] (replacement
+        uses the same entries, looked up by the surface morph without its last character)."""
+
+    @abstractmethod
+    def get_duplication(self, morph):
+        """Return the (root, trans, blocked suffixes) of the root with morph = root + root[-1], or None."""
+
+    def replacement_label(self, old_char, new_char):
+        """Return the trans label for replacing `old_char` with `new_char`."""
+        label = self.replacement_labels.get((old_char, new_char))
+        if label is None:
+            label = 'REP-%s+%s' % (old_char, new_char)
+            self.replacement_labels[(old_char, new_char)] = label
+        return label
+
+
+class TransRuleIndex(RuleIndex):
+    """A RuleIndex built once per word dictionary, so that TokenAnalyzer.get_candidates can look up the possible roots
+    of a surface morph instead of constructing and probing strings."""
+
+    def __init__(self, word_dict, min_stem_len, max_suffix_len):
+        """Build the index for `word_dict`."""
+        RuleIndex.__init__(self, get_morph_dict(word_dict, min_stem_len), min_stem_len, max_suffix_len)
+
+        # collect the suffixes blocked for each root
+        blocked = {}
+        for word in word_dict:
+            for suffix_len in range(2, min(max_suffix_len, len(word) - 1) + 1):
+                root = word[:-suffix_len]
+                if root in word_dict:
+                    if root in blocked:
+                        blocked[root].add(word[-suffix_len:])
+                    else: blocked[root] = {word[-suffix_len:]}
+        no_suffixes = frozenset()
+
+        # deletion: maps the surface morph to its (root, trans, blocked suffixes), where morph = root - root[-1]
+        self.deletions = {}
+        for morph, roots in self.morph_dict.items():
+            self.deletions[morph] = tuple((root, 'DEL-' + root[-1], blocked.get(root, no_suffixes)) for root in roots)
+        # duplication: maps the surface morph to its (root, trans, blocked suffixes), where morph = root + root[-1]
+        self.duplications = {}
+        for root in word_dict:
+            if len(root) + 1 > max(2, min_stem_len):
+                self.duplications[root + root[-1]] = (root, 'DUP-' + root[-1], blocked.get(root, no_suffixes))
+
+    def get_deletions(self, morph):
+        return self.deletions.get(morph, ())
+
+    def get_duplication(self, morph):
+        return self.duplications.get(morph)
+
+
+class _BlockedSuffixes():
+    """The suffixes blocked for a root (see RuleIndex), tested against the word dictionary when asked."""
+
+    __slots__ = ('root', 'word_dict', 'max_suffix_len')
+
+    def __init__(self, root, word_dict, max_suffix_len):
+        self.root = root
+        self.word_dict = word_dict
+        self.max_suffix_len = max_suffix_len
+
+    def __contains__(self, suffix):
+        return 2 <= len(suffix) <= self.max_suffix_len and self.root + suffix in self.word_dict
+
+
+class LazyTransRuleIndex(RuleIndex):
+    """A RuleIndex that answers each lookup from the word and morph dictionaries when it's made, instead of building
+    the index up front.
+
+    This suits read-only dictionaries that aren't loaded into memory (see mappedmodel), where building the index would
+    read the whole lexicon, and dictionaries that grow after training (see MorphAnalyzer.update). Lookups give the same
+    results as those of TransRuleIndex.
+    """
+
+    def __init__(self, word_dict, morph_dict, min_stem_len, max_suffix_len):
+        """Save the dictionaries (`morph_dict` as made by get_morph_dict for `word_dict`)."""
+        RuleIndex.__init__(self, morph_dict, min_stem_len, max_suffix_len)
+        self.word_dict = word_dict
+
+    def get_deletions(self, morph):
+        roots = self.morph_dict.get(morph)
+        if not roots:
+            return ()
+        word_dict, max_suffix_len = self.word_dict, self.max_suffix_len
+        return tuple((root, 'DEL-' + root[-1], _BlockedSuffixes(root, word_dict, max_suffix_len)) for root in roots)
+
+    def get_duplication(self, morph):
+        if len(morph) <= max(2, self.min_stem_len) or morph[-1] != morph[-2]:
+            return None
+        root = morph[:-1]
+        if root not in self.word_dict:
+            return None
+        return (root, 'DUP-' + root[-1], _BlockedSuffixes(root, self.word_dict, self.max_suffix_len))
+
+
 class TokenAnalyzer:
     """Class for analyzing tokens."""
 
-    def __init__(self, word_dict, suffix_dict, min_stem_len, max_suffix_len, use_trans_rules):
-        """Save parameters."""
+    def __init__(self, word_dict, suffix_dict, min_stem_len, max_suffix_len, use_trans_rules, symbols,
+                 rule_index=None):
+        """Save parameters.
+
+        `suffix_dict` is keyed by suffix ids from `symbols`, the SymbolTable shared by the candidate lattices.
+        `rule_index` is a RuleIndex of `word_dict`; a TransRuleIndex is built here if it isn't given.
+        """
         self.word_dict = word_dict
         self.suffix_dict = suffix_dict
-        self.morph_dict = get_morph_dict(word_dict, min_stem_len)
+        self.symbols = symbols
+        self.suffix_trie = SuffixTrie(symbols[suffix_id] for suffix_id in suffix_dict)
+        if rule_index is None:
+            rule_index = TransRuleIndex(word_dict, min_stem_len, max_suffix_len)
+        self.rule_index = rule_index
+        self.morph_dict = rule_index.morph_dict
         self.min_stem_len = min_stem_len
         self.max_suffix_len = max_suffix_len
         self.use_trans_rules = use_trans_rules
 
     def analyze_token(self, token):
-        """Get possible segmentations for each possible division of the token into a morph and a suffix.
+        """Get possible segmentations (as SegStructures) for each possible division of the token into a morph and a
+        suffix."""
+        return [SegStructure(token, morph, root, trans, suffix)
+                for morph, root, trans, suffix in self.get_candidates(token)]
+
+    def get_candidates(self, token):
+        """Get possible segmentations for each possible division of the token into a morph and a suffix, as
+        (morph, root, trans, suffix) tuples.
 
         Use rules to determine the simplest transformation accounting for any differences between underlying and surface
         representations.
@@ -47,23 +323,19 @@ class TokenAnalyzer:
             morph = token
             trans = '$'
             suffix = '$'
-            ts = SegStructure(token, morph, root, trans, suffix)
-            segs.append(ts)
+            segs.append((morph, root, trans, suffix))
             return segs
         # The word is long enough to be morphologically complex, so check for possible suffixes.
         s_indx = max(self.min_stem_len, len(token)-self.max_suffix_len)
-        for indx in range(s_indx, len(token)):
+        for indx in self.suffix_trie.split_points(token, s_indx):
             suffix = token[indx:]
-            if not suffix in self.suffix_dict:
-                continue
             morph = token[:indx]
             root = morph
             trans = '$'
             # avoid the single character suffix with a large number of non-occurring roots, by starting with a small
             # stem and increasing until a word is encountered
             if root in self.word_dict:
-                ts = SegStructure(token, morph, root, trans, suffix)
-                segs.append(ts)
+                segs.append((morph, root, trans, suffix))
                 continue
 
             if not self.use_trans_rules:
@@ -77,64 +349,103 @@ class TokenAnalyzer:
             if len(suffix) < 2:
                 continue
             # --------------------------------Hypothesize deletion rules
+            rules = self.rule_index
             found_possible_root = False
-            if morph in self.morph_dict:
-                for root in self.morph_dict[morph]:
-                    if root + suffix in self.word_dict:
-                        continue
-                    found_possible_root = True
-                    if root[-1] == suffix[0]:
-                        # : voiced = voic(voice-e)+ed
-                        trans = 'DEL-' + root[-1]
-                        ts = SegStructure(token, morph, root, trans, suffix)
-                        segs.append(ts)
-                    else:
-                        trans = 'DEL-' + root[-1]
-                        # : voiced = voic(voice-e)+ed
-                        ts = SegStructure(token, morph, root, trans, suffix)
-                        segs.append(ts)
+            for root, trans, blocked_suffixes in rules.get_deletions(morph):
+                if suffix in blocked_suffixes:
+                    continue
+                found_possible_root = True
+                # : voiced = voic(voice-e)+ed
+                segs.append((morph, root, trans, suffix))
             if found_possible_root:
                 continue
             # --------------------------------Hypothesize replacement rules
             # : carried = carry -y+i + ed; morph = carri
-            if (morph[:-1] in self.morph_dict) and (not morph in self.word_dict):
+            # (morph is never a word here, since that case was handled above)
+            for root, _trans, blocked_suffixes in rules.get_deletions(morph[:-1]):
                 # avoid painting = paint REP-t+t +ing
-                for root in self.morph_dict[morph[:-1]]:
-                    if root == morph:
-                        continue
-                    if root + suffix in self.word_dict:
-                        continue
-                    found_possible_root = True
-                    trans = 'REP-%s+%s' % (root[-1], morph[-1])
-                    ts = SegStructure(token, morph, root, trans, suffix)
-                    segs.append(ts)
+                if root == morph:
+                    continue
+                if suffix in blocked_suffixes:
+                    continue
+                found_possible_root = True
+                trans = rules.replacement_label(root[-1], morph[-1])
+                segs.append((morph, root, trans, suffix))
             if found_possible_root:
                 continue
             # --------------------------------Hypothesize duplication rules
             # avoid passes = pas + DUP+s +es, since pass is already a word
-            if (len(morph) > max(2, self.min_stem_len)) and (morph[-1] == morph[-2]):
-                root = morph[:-1]
-                if (root in self.word_dict) and root + suffix not in self.word_dict:
-                    trans = 'DUP-' + morph[-1]
-                    ts = SegStructure(token, morph, root, trans, suffix)
-                    segs.append(ts)
+            duplication = rules.get_duplication(morph)
+            if duplication is not None:
+                root, trans, blocked_suffixes = duplication
+                if suffix not in blocked_suffixes:
+                    segs.append((morph, root, trans, suffix))
         if not segs:  # produce at least one possible segmentation if none were found
             root = token
             morph = token
             trans = '$'
             suffix = '$'
-            ts = SegStructure(token, morph, root, trans, suffix)
-            segs.append(ts)
+            segs.append((morph, root, trans, suffix))
         return segs
 
-    def analyze_token_list(self, token_list):
-        """Apply self.analyze_token to each token in the list."""
-        token_segs = []
+    def analyze_token_list(self, token_list, num_workers=1):
+        """Collect the candidate segmentations of each token in the list into a CandidateLattice.
+
+        If `num_workers` is greater than 1, the list is sharded across that many worker processes. The result is the
+        same as the serial one, in the same order.
+        """
+        if num_workers > 1:
+            return self.__analyze_token_list_parallel(list(token_list), num_workers)
+        token_segs = CandidateLattice(self.symbols)
         for token in token_list:
-            segs = self.analyze_token(token)
-            token_segs.append(segs)
+            token_segs.append(token, self.get_candidates(token))
         return token_segs
 
+    def __analyze_token_list_parallel(self, token_list, num_workers):
+        """Split the token list into contiguous chunks, and analyze the chunks in a pool of worker processes."""
+        token_segs = CandidateLattice(self.symbols)
+        if not token_list:
+            return token_segs
+        with worker_pool(self, num_workers) as pool:
+            chunk_segs = pool.map(_analyze_chunk, split_list(token_list, num_workers))
+        for segs in chunk_segs:
+            token_segs.extend(segs)
+        return token_segs
+
+    def analyze_token_batches(self, token_list, batch_size, num_workers=1):
+        """Yield a CandidateLattice for each consecutive batch of (at most) `batch_size` tokens from the list.
+
+        Only a few batches are alive at a time, so the candidates of the whole list are never held in memory at once.
+        If `num_workers` is greater than 1, the batches are analyzed in that many worker processes and yielded in order;
+        only a bounded window of batches is in flight (see workers.imap_bounded).
+        """
+        token_iter = iter(token_list)
+        batches = iter(lambda: list(islice(token_iter, batch_size)), [])
+        if num_workers <= 1:
+            for batch in batches:
+                token_segs = CandidateLattice(self.symbols)
+                for token in batch:
+                    token_segs.append(token, self.get_candidates(token))
+                yield token_segs
+            return
+        with worker_pool(self, num_workers) as pool:
+            for segs in imap_bounded(pool, _analyze_chunk, batches, num_workers):
+                token_segs = CandidateLattice(self.symbols)
+                token_segs.extend(segs)
+                yield token_segs
+
+
+def _analyze_chunk(token_chunk):
+    """Analyze a chunk of tokens in a worker process.
+
+    The chunk gets its own small symbol table, which is merged into the shared one by CandidateLattice.extend.
+    """
+    ta = get_shared()
+    token_segs = CandidateLattice()
+    for token in token_chunk:
+        token_segs.append(token, ta.get_candidates(token))
+    return token_segs
+
 
 def get_morph_dict(word_dict, min_stem_len):
     """Create a dictionary mapping words without the last character to the possible words represented."""
@@ -0,0 +1,238 @@
+'''A columnar binary file format for segmentations, written in row groups and read in place. Created on Oct 17, 2026.
+'''
+
+
+import bisect
+import mmap
+import struct
+import sys
+from array import array
+from collections.abc import Sequence
+from itertools import accumulate, chain, islice
+from mappedmodel import MappedStrings
+
+
+SEGFILE_MAGIC = b'PARAMA\x00S'
+SEGFILE_VERSION = 2
+ROW_GROUP_SIZE = 100000  # the number of segmentations in a row group when they're given all at once
+
+# Layout (all integers little-endian):
+#   magic (8 bytes), version (uint32), 4 bytes of padding
+#   row groups, one for each batch of segmentations written; each is eight sections, starting at multiples of 8 bytes:
+#       word offsets (int64, one more than the number of words) into the concatenated UTF-8 bytes of the words
+#       morph offsets (int64, one more than the number of words) into the morph ids (int32)
+#       component offsets (int64, one more than the number of words) into the component ids (int32, three per
+#           component: root, trans, suffix)
+#       the strings of the pool of morphs and component parts first used in this row group: offsets (int64) and
+#           concatenated UTF-8 bytes; pool ids number the strings of all row groups in order
+#   footer: a uint64 array of the number of row groups, then the number of rows and the (offset, length) of the eight
+#       sections of each row group
+#   the offset of the footer (uint64), and the magic again
+_GROUP_SECTIONS = 8
+_TRAILER = struct.Struct('<Q8s')
+
+
+class SegmentationWriter():
+    """Writes segmentations to a file in the columnar format, a batch (row group) at a time.
+
+    Each batch is written as soon as it's given, with the strings it adds to the pool; only the ids of the strings of
+    the pool are held until the file is closed.
+    """
+
+    def __init__(self, path):
+        """Create the file at `path`."""
+        if sys.byteorder != 'little':
+            raise ValueError('Segmentation files can only be written on little-endian machines')
+        self.fout = open(path, 'wb')
+        self.fout.write(SEGFILE_MAGIC)
+        self.fout.write(struct.pack('<I4x', SEGFILE_VERSION))
+        self.pool_ids = {}
+        self.groups = []  # the number of rows and section (offset, length) pairs of each row group
+
+    def __intern(self, strings, new_strings):
+        """Return an array of the pool ids of a list of strings, adding new strings to the pool and to `new_strings`."""
+        pool_ids = self.pool_ids
+        for string in dict.fromkeys(strings):
+            if string not in pool_ids:
+                pool_ids[string] = len(pool_ids)
+                new_strings.append(string.encode('utf-8'))
+        return array('i', map(pool_ids.__getitem__, strings))
+
+    def __write_section(self, data):
+        """Write a section at the next multiple of 8 bytes, returning its (offset, length)."""
+        fout = self.fout
+        fout.write(bytes(-fout.tell() % 8))
+        offset = fout.tell()
+        fout.write(data)
+        return offset, memoryview(data).nbytes
+
+    def write(self, words, word_segs):
+        """Write a row group of words with their segmentations, as returned by MorphAnalyzer.segment_token_list."""
+        encoded = [word.encode('utf-8') for word in words]
+        seg_morphs = [morphs for morphs, _components in word_segs]
+        seg_components = [components for _morphs, components in word_segs]
+        if len(seg_morphs) != len(encoded):
+            raise ValueError('Expected a segmentation for each of the %s words' % len(encoded))
+        word_offsets = array('q', accumulate(map(len, encoded), initial=0))
+        morph_offsets = array('q', accumulate(map(len, seg_morphs), initial=0))
+        component_offsets = array('q', accumulate(map(len, seg_components), initial=0))
+        # intern the strings of all segmentations at once
+        new_strings = []
+        morph_ids = self.__intern(list(chain.from_iterable(seg_morphs)), new_strings)
+        component_ids = self.__intern(list(chain.from_iterable(chain.from_iterable(seg_components))), new_strings)
+        pool_offsets = array('q', accumulate(map(len, new_strings), initial=0))
+        sections = [self.__write_section(data) for data in (word_offsets, b''.join(encoded), morph_offsets, morph_ids,
+                                                             component_offsets, component_ids, pool_offsets,
+                                                             b''.join(new_strings))]
+        self.groups.append((len(encoded), sections))
+
+    def close(self):
+        """Write the footer, and close the file."""
+        if self.fout.closed:
+            return
+        footer = array('Q', [len(self.groups)])
+        for num_rows, sections in self.groups:
+            footer.append(num_rows)
+            for offset, length in sections:
+                footer.extend((offset, length))
+        footer_offset, _length = self.__write_section(footer)
+        self.fout.write(_TRAILER.pack(footer_offset, SEGFILE_MAGIC))
+        self.fout.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_segmentations(word_segs, path, row_group_size=ROW_GROUP_SIZE):
+    """Write an iterable of (word, segmentation) pairs to a file in the columnar format, in row groups of
+    `row_group_size` words."""
+    word_seg_iter = iter(word_segs)
+    with SegmentationWriter(path) as writer:
+        for batch in iter(lambda: list(islice(word_seg_iter, row_group_size)), []):
+            writer.write([word for word, _seg in batch], [seg for _word, seg in batch])
+
+
+class RowGroup():
+    """The columns of a row group of a segmentation file, as typed views of the mapped file.
+
+    The segmentation of row `i` has the morphs with the pool ids morph_ids[morph_offsets[i]:morph_offsets[i + 1]], and
+    the components whose (root, trans, suffix) pool ids are in
+    component_ids[3 * component_offsets[i]:3 * component_offsets[i + 1]]. `new_strings` are the strings of the pool
+    first used in this row group.
+    """
+
+    def __init__(self, sections):
+        self.words = MappedStrings(sections[0].cast('q'), sections[1])
+        self.morph_offsets = sections[2].cast('q')
+        self.morph_ids = sections[3].cast('i')
+        self.component_offsets = sections[4].cast('q')
+        self.component_ids = sections[5].cast('i')
+        self.new_strings = MappedStrings(sections[6].cast('q'), sections[7])
+
+    def __len__(self):
+        return len(self.words)
+
+
+class PoolStrings(Sequence):
+    """The string pool of a segmentation file, made of the new strings of each row group in turn."""
+
+    def __init__(self, groups):
+        self.groups = groups
+        self.starts = [0]  # the pool id of the first new string of each row group, then the size of the pool
+        for group in groups:
+            self.starts.append(self.starts[-1] + len(group.new_strings))
+
+    def __getitem__(self, sid):
+        g = bisect.bisect_right(self.starts, sid) - 1
+        return self.groups[g].new_strings[sid - self.starts[g]]
+
+    def __len__(self):
+        return self.starts[-1]
+
+
+class SegmentationFile(Sequence):
+    """A segmentation file in the columnar format, opened with mmap.
+
+    Row `i` is the pair (word, (morphs, components)), as written. The columns of each row group are in `groups`, and
+    the strings their ids refer to in `pool`; neither is copied out of the mapping.
+    """
+
+    def __init__(self, path):
+        """Map the file at `path`."""
+        if sys.byteorder != 'little':
+            raise ValueError('Segmentation files can only be read on little-endian machines')
+        with open(path, 'rb') as fin:
+            self.mmap = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self.mmap)
+        if len(buffer) < 16 + _TRAILER.size or bytes(buffer[:len(SEGFILE_MAGIC)]) != SEGFILE_MAGIC:
+            raise ValueError('%s is not a segmentation file' % path)
+        (version,) = struct.unpack_from('<I', buffer, len(SEGFILE_MAGIC))
+        if version != SEGFILE_VERSION:
+            raise ValueError('Unsupported segmentation file version %s in %s (expected %s)' % (version, path,
+                                                                                               SEGFILE_VERSION))
+        footer_offset, magic = _TRAILER.unpack_from(buffer, len(buffer) - _TRAILER.size)
+        if magic != SEGFILE_MAGIC:
+            raise ValueError('Truncated segmentation file %s' % path)
+        footer = buffer[footer_offset:len(buffer) - _TRAILER.size].cast('Q')
+
+        def section(position):
+            offset, length = footer[position], footer[position + 1]
+            return buffer[offset:offset + length]
+
+        self.groups = []
+        self.group_starts = [0]  # the row index of the first row of each row group, then the number of rows
+        position = 1
+        for _i in range(footer[0]):
+            self.groups.append(RowGroup([section(position + 1 + 2 * i) for i in range(_GROUP_SECTIONS)]))
+            self.group_starts.append(self.group_starts[-1] + footer[position])
+            position += 1 + 2 * _GROUP_SECTIONS
+        self.pool = PoolStrings(self.groups)
+
+    def __get_row(self, group, i):
+        """Decode row `i` of a row group."""
+        pool = self.pool
+        morph_offsets, component_offsets = group.morph_offsets, group.component_offsets
+        morphs = tuple(pool[sid] for sid in group.morph_ids[morph_offsets[i]:morph_offsets[i + 1]])
+        parts = [pool[sid] for sid in group.component_ids[3 * component_offsets[i]:3 * component_offsets[i + 1]]]
+        return group.words[i], (morphs, tuple(zip(parts[0::3], parts[1::3], parts[2::3])))
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('segmentation index out of range')
+        g = bisect.bisect_right(self.group_starts, i) - 1
+        return self.__get_row(self.groups[g], i - self.group_starts[g])
+
+    def __iter__(self):
+        # decode the pool and the columns of each row group at once, rather than a row at a time; a row group only uses
+        # the strings of the pool added by it and by the row groups before it
+        pool = []
+        for group in self.groups:
+            new_strings = group.new_strings
+            pool.extend(new_strings[i] for i in range(len(new_strings)))
+            word_data = bytes(group.words.data)
+            word_offsets = group.words.offsets.tolist()
+            morph_offsets = group.morph_offsets.tolist()
+            morphs = list(map(pool.__getitem__, group.morph_ids.tolist()))
+            component_offsets = group.component_offsets.tolist()
+            parts = list(map(pool.__getitem__, group.component_ids.tolist()))
+            components = list(zip(parts[0::3], parts[1::3], parts[2::3]))
+            for i in range(len(group)):
+                yield (word_data[word_offsets[i]:word_offsets[i + 1]].decode('utf-8'),
+                       (tuple(morphs[morph_offsets[i]:morph_offsets[i + 1]]),
+                        tuple(components[component_offsets[i]:component_offsets[i + 1]])))
+
+    def __len__(self):
+        return self.group_starts[-1]
+
+
+def is_segmentation_file(path):
+    """Return whether the file at `path` is a segmentation file."""
+    with open(path, 'rb') as fin:
+        return fin.read(len(SEGFILE_MAGIC)) == SEGFILE_MAGIC
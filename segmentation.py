@@ -5,7 +5,7 @@ Created on Jun 11, 2018
 '''
 
 
-def get_seg_dict_by_token_dict(token_seg_dict):
+def get_seg_dict_by_token_dict(token_seg_dict, broken_cycles=None):
     """Converts from: a mapping from tokens to their immediate segmentation
                   to: a mapping from tokens to their component subtokens, with hierarchical combination information.
 
@@ -17,59 +17,78 @@ def get_seg_dict_by_token_dict(token_seg_dict):
             ('on', (('on',), (('on', '$', '$'),))),
             ('theon', (('the', 'on'), (('the', '$', '$'), ('the', '$', 'on'))))
         ]
+
+    Each word is resolved exactly once, after its root (a depth-first topological order). A word whose root depends on
+    the word itself (e.g. a root equal to the word) would make the derivation cyclic; its root is treated as atomic
+    instead, and the (word, root) pair is appended to `broken_cycles` if it's given.
     """
     seg_dict = {}
+    morph_ends = {}  # maps each resolved word to the offsets where its morphs (except the last) end
+    cycle_count = 0
     for word in token_seg_dict.keys():
         if word in seg_dict:
             continue
         wd_stack = [word]
+        on_stack = set(wd_stack)  # words waiting for their roots to be resolved
         while wd_stack:
             wd = wd_stack[-1]
-            if wd in seg_dict:
-                wd_stack.pop()
-                continue
             if wd in token_seg_dict:
                 # get morph, suffix, root, trans for this transformation
                 wd_morph, wd_suffix, wd_root, wd_trans = token_seg_dict[wd]
                 if wd_suffix == '$' or wd_suffix == '':  # if we've reached the bottom root
                     seg_dict[wd] = ((wd_morph,), ((wd_root, wd_trans, wd_suffix),))
-                    wd_stack.pop()
-                    continue
+                    morph_ends[wd] = ()
                 elif wd_root in seg_dict:
                     # The root is morphologically complex, and we already know the breakdown.
-                    # examples: loneliness = loneli (lonely -y+i) +ness;    lonely = lone () +ly
-                    # Alignment:
-                    # --REP: lone+ly -> lone+li
-                    # --DEL: en+force -> en+forc
-                    # --DUP: under+pin -> under+pinn
-                    rt_seg = seg_dict[wd_root]
-                    rt_morphs = rt_seg[0]
-                    morphs = []
-                    indx = 0
-                    for i in range(len(rt_morphs)-1):
-                        rt_morph = rt_morphs[i]
-                        morphs.append(wd_morph[indx:indx+len(rt_morph)])
-                        indx += len(rt_morph)
-                    morphs.append(wd_morph[indx:])
-                    morphs.append(wd_suffix)
-                    components = list(rt_seg[1])
-                    components.append((wd_root, wd_trans, wd_suffix))
-                    seg_dict[wd] = (tuple(morphs), tuple(components))
-                    wd_stack.pop()
-                    continue
+                    seg_dict[wd], morph_ends[wd] = _derive_seg(
+                        wd_morph, wd_suffix, wd_root, wd_trans, seg_dict[wd_root][1], morph_ends[wd_root])
+                elif wd_root in on_stack:
+                    # The root depends on this word, so break the cycle by treating the root as atomic.
+                    cycle_count += 1
+                    if broken_cycles is not None:
+                        broken_cycles.append((wd, wd_root))
+                    seg_dict[wd], morph_ends[wd] = _derive_seg(
+                        wd_morph, wd_suffix, wd_root, wd_trans, ((wd_root, '$', '$'),), ())
                 else:
                     # The root is morphologically complex, but we don't have the breakdown yet.
                     wd_stack.append(wd_root)  # add it to the stack of words to handle
+                    on_stack.add(wd_root)
                     continue
             else:
                 # inferred non-appearing root
                 # example: communicating = communicat + ing
                 seg_dict[wd] = ((wd,), ((wd, '$', '$'),))
-                wd_stack.pop()
-                continue
+                morph_ends[wd] = ()
+            wd_stack.pop()
+            on_stack.discard(wd)
+    if cycle_count:
+        print('--broke %s cyclic derivations' % cycle_count)
     return seg_dict
 
 
+def _derive_seg(wd_morph, wd_suffix, wd_root, wd_trans, rt_components, rt_morph_ends):
+    """Segment a word derived from a root with the given components and morph end offsets.
+
+    The morph of the word is split where the morphs of the root end, and the suffix is added. Returns the segmentation
+    of the word and its own morph end offsets.
+    examples: loneliness = loneli (lonely -y+i) +ness;    lonely = lone () +ly
+    Alignment:
+    --REP: lone+ly -> lone+li
+    --DEL: en+force -> en+forc
+    --DUP: under+pin -> under+pinn
+    """
+    morph_len = len(wd_morph)
+    ends = tuple(min(end, morph_len) for end in rt_morph_ends) + (morph_len,)
+    morphs = []
+    start = 0
+    for end in ends:
+        morphs.append(wd_morph[start:end])
+        start = end
+    morphs.append(wd_suffix)
+    components = rt_components + ((wd_root, wd_trans, wd_suffix),)
+    return (tuple(morphs), components), ends
+
+
 def seg_dict_update(seg_dict):
     """This function appears to split up morphologically complex roots further. It's not used anywhere."""
     #Recursively update segmentation if root is segmented
@@ -102,13 +121,17 @@ def seg_dict_update(seg_dict):
     seg_dict.update(updated_seg)
 
 
-def get_seg_dict_by_paradigms(paradigm_dict):
-    """Given paradigms, create a mapping from tokens to their segmentation info."""
+def get_seg_dict_by_paradigms(paradigm_dict, symbols):
+    """Given paradigms, create a mapping from tokens to their segmentation info.
+
+    Roots, transformations, and suffixes in the paradigms are symbol ids from `symbols`; they're converted back to
+    strings here.
+    """
     # create a mapping from tokens to the transformation that creates them
     token_seg_dict = {}
     for root, word_list in paradigm_dict.items():
         for word, trans, suffix, stem in word_list:
-            token_seg_dict[word] = (stem, suffix, root, trans)
+            token_seg_dict[word] = (stem, symbols[suffix], symbols[root], symbols[trans])
     # convert to a mapping from tokens to their segmentation info in a hierarchical structure
     seg_dict = get_seg_dict_by_token_dict(token_seg_dict)
     return seg_dict
@@ -5,7 +5,8 @@ Created on Jun 11, 2018
 '''
 
 
-import math
+import numpy as np
+from workers import worker_pool, get_shared, split_list
 
 
 def filter_afx_by_freq(afx_dict, min_afx_freq):
@@ -33,14 +34,34 @@ def group_afx_by_length(affix_stem_len_dist):
     return groups, min_root_len, max_root_len
 
 
-def gen_suf_cand_by_stem_len(word_dict, min_stem_len, max_suf_len, min_suf_freq=1):
+def gen_suf_cand_by_stem_len(word_dict, min_stem_len, max_suf_len, min_suf_freq=1, num_workers=1):
     """Collect possible suffix candidates with a dictionary of stem lengths and frequencies (counts of distinct stem
     lengths).
 
-    Optionally filter suffix candidates by minimum frequency.
+    Optionally filter suffix candidates by minimum frequency. If `num_workers` is greater than 1, the words are counted
+    in chunks by that many worker processes, and the counts are merged; the result is the same as the serial one.
+    """
+    if num_workers > 1:
+        with worker_pool(word_dict, num_workers) as pool:
+            chunk_suf_dicts = pool.starmap(
+                _count_suf_cand_chunk,
+                [(chunk, min_stem_len, max_suf_len) for chunk in split_list(list(word_dict), num_workers)])
+        suf_dict = merge_suf_cand_counts(chunk_suf_dicts)
+    else:
+        suf_dict = count_suf_cand_by_stem_len(word_dict, word_dict, min_stem_len, max_suf_len)
+    if min_suf_freq <= 1:
+        return suf_dict
+    # filter infrequent suffixes
+    return filter_afx_by_freq(suf_dict, min_suf_freq)
+
+
+def count_suf_cand_by_stem_len(words, word_dict, min_stem_len, max_suf_len):
+    """Count the stem lengths of the suffix candidates of `words`, where the stems are looked up in `word_dict`.
+
+    The counts of separate lists of words can be combined with merge_suf_cand_counts.
     """
     suf_dict = {}
-    for word in word_dict:
+    for word in words:
         if len(word) <= min_stem_len:
             continue
         sIndx = max(min_stem_len, len(word) - max_suf_len)
@@ -59,10 +80,66 @@ def gen_suf_cand_by_stem_len(word_dict, min_stem_len, max_suf_len, min_suf_freq=
                         suf_len_dict[stem_len] = 1
                 else:
                     suf_dict[suf] = {stem_len:1}
-    if min_suf_freq <= 1:
-        return suf_dict
-    # filter infrequent suffixes
-    return filter_afx_by_freq(suf_dict, min_suf_freq)
+    return suf_dict
+
+
+def _count_suf_cand_chunk(words, min_stem_len, max_suf_len):
+    """Count the suffix candidates of a chunk of words in a worker process, against the shared word dictionary."""
+    return count_suf_cand_by_stem_len(words, get_shared(), min_stem_len, max_suf_len)
+
+
+def merge_suf_cand_counts(suf_dicts):
+    """Add up the counts from count_suf_cand_by_stem_len for consecutive lists of words.
+
+    The merge is associative, and keeps suffixes and stem lengths in the order they'd have been counted serially.
+    """
+    merged_suf_dict = {}
+    for suf_dict in suf_dicts:
+        for suf, stem_len_dist in suf_dict.items():
+            if suf in merged_suf_dict:
+                merged_stem_len_dist = merged_suf_dict[suf]
+                for stem_len, count in stem_len_dist.items():
+                    if stem_len in merged_stem_len_dist:
+                        merged_stem_len_dist[stem_len] += count
+                    else:
+                        merged_stem_len_dist[stem_len] = count
+            else:
+                merged_suf_dict[suf] = dict(stem_len_dist)
+    return merged_suf_dict
+
+
+def build_stem_len_matrix(affix_stem_len_dist, min_stem_len, max_stem_len):
+    """Put the stem length distributions of a list of affixes into a dense (affix x stem length) count matrix.
+
+    Column `i` holds the counts for stem length `min_stem_len + i`. Returns the list of affixes and the matrix.
+    """
+    afxes = []
+    rows, cols, counts = [], [], []
+    for row, (afx, stem_len_dist) in enumerate(affix_stem_len_dist):
+        afxes.append(afx)
+        for stem_len, count in stem_len_dist.items():
+            if min_stem_len <= stem_len <= max_stem_len:
+                rows.append(row)
+                cols.append(stem_len - min_stem_len)
+                counts.append(count)
+    matrix = np.zeros((len(afxes), max(0, max_stem_len - min_stem_len + 1)))
+    matrix[rows, cols] = counts
+    return afxes, matrix
+
+
+def calc_expected_stem_len_scores(stem_len_matrix, min_stem_len):
+    """Calculate the confidence values of all affixes at once from their stem length matrix.
+
+    This is equation (1) in the paper. Returns arrays of the scores, smoothed counts, and expected stem lengths.
+    """
+    # smoothing by plus .001
+    epi = 0.001
+    smoothed = stem_len_matrix + epi
+    stem_lens = np.arange(min_stem_len, min_stem_len + stem_len_matrix.shape[1])
+    count_sums = smoothed.sum(axis=1)
+    len_exps = smoothed.dot(stem_lens) / count_sums
+    scores = np.log10(1 + count_sums) * len_exps
+    return scores, count_sums, len_exps
 
 
 def calc_expected_stem_len(affix_stem_len_dist, min_stem_len, max_stem_len):
@@ -70,32 +147,41 @@ def calc_expected_stem_len(affix_stem_len_dist, min_stem_len, max_stem_len):
 
     This is equation (1) in the paper.
     """
-    # smoothing by plus .001
-    epi = 0.001
-    afx_len_exp = []
-    for afx, stem_len_dist in affix_stem_len_dist:
-        count_sum = 0.0
-        len_sum = 0.0
-        for stem_len in range(min_stem_len, max_stem_len+1):
-            count = epi
-            if stem_len in stem_len_dist:
-                count += stem_len_dist[stem_len]
-            count_sum += count
-            len_sum += stem_len * count
-        len_exp = len_sum / count_sum
-        afx_score = math.log10(1 + count_sum) * len_exp
-        afx_len_exp.append((afx, afx_score, count_sum, len_exp))
-    return afx_len_exp
-
-
-def calc_suf_score_by_dist(paradigm_dict):
-    """Get the score for each suffix by calculating the expected length of its root."""
+    afxes, matrix = build_stem_len_matrix(affix_stem_len_dist, min_stem_len, max_stem_len)
+    scores, count_sums, len_exps = calc_expected_stem_len_scores(matrix, min_stem_len)
+    return list(zip(afxes, scores.tolist(), count_sums.tolist(), len_exps.tolist()))
+
+
+def top_n_indices(scores, top_N):
+    """Return the indices of the `top_N` highest scores, from highest to lowest.
+
+    This uses a partial sort, but breaks ties by position like a full stable sort would.
+    """
+    if top_N <= 0:
+        return np.zeros(0, dtype=int)
+    if len(scores) > top_N:
+        # everything scoring above the top_N-th score is in, and ties with it are taken in order
+        threshold = np.partition(scores, len(scores) - top_N)[len(scores) - top_N]
+        above = np.flatnonzero(scores > threshold)
+        ties = np.flatnonzero(scores == threshold)[:top_N - len(above)]
+        indices = np.concatenate((above, ties))
+        indices.sort()
+    else:
+        indices = np.arange(len(scores))
+    return indices[np.argsort(-scores[indices], kind='stable')]
+
+
+def calc_suf_score_by_dist(paradigm_dict, symbols):
+    """Get the score for each suffix by calculating the expected length of its root.
+
+    Roots and suffixes in the paradigms are symbol ids from `symbols`.
+    """
     suffix_root_len_dist = {}
     min_root_len = 100
     max_root_len = 0
     # get the root length distribution for each suffix
     for root, derived_word_list in paradigm_dict.items():
-        root_len = len(root)
+        root_len = len(symbols[root])
         min_root_len = min(min_root_len, root_len)  # eventually get the length of the smallest root
         max_root_len = max(max_root_len, root_len)  # eventually get the length of the longest root
         for _word, _trans, suffix, _morph in derived_word_list:
@@ -122,6 +208,17 @@ def calc_suf_score_by_dist(paradigm_dict):
     return suffix_score_dict
 
 
+def calc_suf_score_by_matrix(paradigm_matrix, symbols):
+    """Get the score for each suffix by calculating the expected length of its root, from a ParadigmMatrix.
+
+    The scores are the same as those of calc_suf_score_by_dist on the paradigm dictionary of the matrix.
+    """
+    min_root_len, _max_root_len, matrix = paradigm_matrix.root_len_matrix(symbols)
+    present = np.flatnonzero(paradigm_matrix.suffix_word_freqs())  # suffixes left without words get no score
+    scores, _count_sums, _len_exps = calc_expected_stem_len_scores(matrix[present], min_root_len)
+    return dict(zip(paradigm_matrix.suffix_ids[present].tolist(), scores.tolist()))
+
+
 def filter_afxes(affix_root_len_dist, top_N=50):
     """Return the `top_N` most likely affixes for each affix length.
 
@@ -132,22 +229,23 @@ def filter_afxes(affix_root_len_dist, top_N=50):
     # also get the length of the largest and smallest roots
     same_len_affix_dist, min_root_len, max_root_len = group_afx_by_length(affix_root_len_dist)
     print('Suffix Legth Range: (%s, %s)' % (min(same_len_affix_dist.keys()), max(same_len_affix_dist.keys())))
-    for afx_len, afx_stem_len_dist in sorted(same_len_affix_dist.items(), key=lambda x: x[0]):
+    # calculate affix confidence for every affix at once (equation 1 from the paper)
+    afxes, matrix = build_stem_len_matrix(affix_root_len_dist.items(), min_root_len, max_root_len)
+    scores, _count_sums, _len_exps = calc_expected_stem_len_scores(matrix, min_root_len)
+    afx_lens = np.array([len(afx) for afx in afxes])
+    for afx_len in sorted(same_len_affix_dist):
         print('Processing Suffix Length: %s.' % (afx_len))
-        # calculate affix confidence for each affix (equation 1 from the paper)
-        affix_len_exp = calc_expected_stem_len(afx_stem_len_dist, min_root_len, max_root_len)
-        affix_len_exp = sorted(affix_len_exp, key=lambda x: -x[1])  # sort by affix confidence
-        top_N_afx = affix_len_exp[:top_N]  # get the top_N most likely affixes
-        filtered_affixes.extend(top_N_afx)
-    # get just the affix and the confidence, and sort by confidence
-    filtered_affixes = sorted(
-        [(afx, afx_score) for afx, afx_score, _count, _len_exp in filtered_affixes],
-        key=lambda x: -x[1])
+        group = np.flatnonzero(afx_lens == afx_len)
+        # get the top_N most likely affixes, sorted by affix confidence
+        for i in group[top_n_indices(scores[group], top_N)]:
+            filtered_affixes.append((afxes[i], float(scores[i])))
+    # sort by confidence
+    filtered_affixes = sorted(filtered_affixes, key=lambda x: -x[1])
     return filtered_affixes
 
 
-def gen_N_best_suffix(word_dict, min_stem_len=3, max_suf_len=4, min_suf_freq=10, best_N=50):
+def gen_N_best_suffix(word_dict, min_stem_len=3, max_suf_len=4, min_suf_freq=10, best_N=50, num_workers=1):
     """Get the `best_N` best suffixes according to maximum likelihood."""
-    suffix_stem_len_dist = gen_suf_cand_by_stem_len(word_dict, min_stem_len, max_suf_len, min_suf_freq)
+    suffix_stem_len_dist = gen_suf_cand_by_stem_len(word_dict, min_stem_len, max_suf_len, min_suf_freq, num_workers)
     best_suffix_list = filter_afxes(suffix_stem_len_dist, best_N)
     return best_suffix_list
@@ -0,0 +1,92 @@
+'''Interning of roots, suffixes, and other strings as dense integer ids. Created on Oct 17, 2026.
+'''
+
+
+NULL = '$'  # the empty root, transformation, or suffix
+NULL_ID = 0  # the id of NULL in every SymbolTable
+
+
+class SymbolTable():
+    """A table assigning dense integer ids to roots, suffixes, transformations, and features, so that the model can be
+    keyed and stored by ids instead of by strings."""
+
+    def __init__(self):
+        """Start with a table containing only NULL."""
+        self.ids = {NULL: NULL_ID}  # maps each symbol to its id
+        self.symbols = [NULL]  # maps each id to its symbol
+
+    @classmethod
+    def from_symbols(cls, symbols):
+        """Create a table from a list of symbols in id order (e.g. the `symbols` of another table)."""
+        table = cls()
+        table.symbols = list(symbols)
+        table.ids = dict((symbol, sid) for sid, symbol in enumerate(table.symbols))
+        return table
+
+    def intern(self, symbol):
+        """Return the id of the symbol, adding it to the table if it's new."""
+        sid = self.ids.get(symbol)
+        if sid is None:
+            sid = len(self.symbols)
+            self.ids[symbol] = sid
+            self.symbols.append(symbol)
+        return sid
+
+    def get_id(self, symbol):
+        """Return the id of the symbol, or None if it isn't in the table."""
+        return self.ids.get(symbol)
+
+    def __getitem__(self, sid):
+        """Return the symbol with the given id."""
+        return self.symbols[sid]
+
+    def __contains__(self, symbol):
+        return symbol in self.ids
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+def popcount(mask):
+    """Return the number of members of the set stored as the bitmask `mask`."""
+    return bin(mask).count('1')
+
+
+class SymbolBits():
+    """Assigns bit positions to symbol ids, so that sets of symbols (e.g. the suffixes of a paradigm) can be stored as
+    integer bitmasks. The mask of a set is its canonical hashable form, and intersections and sizes are single integer
+    operations.
+
+    Positions are dense and assigned in order of first use, so masks stay small even when the ids don't.
+    """
+
+    def __init__(self):
+        """Start with no positions assigned."""
+        self.positions = {}  # maps each symbol id to its bit position
+        self.sids = []  # maps each bit position to its symbol id
+
+    def bit(self, sid):
+        """Return the single-bit mask of the symbol id, assigning it a position if it's new."""
+        position = self.positions.get(sid)
+        if position is None:
+            position = len(self.sids)
+            self.positions[sid] = position
+            self.sids.append(sid)
+        return 1 << position
+
+    def mask(self, sids):
+        """Return the bitmask of the set of symbol ids."""
+        mask = 0
+        for sid in sids:
+            mask |= self.bit(sid)
+        return mask
+
+    def members(self, mask):
+        """Return the symbol ids in the bitmask, sorted by id."""
+        sids = []
+        while mask:
+            low = mask & -mask
+            sids.append(self.sids[low.bit_length() - 1])
+            mask ^= low
+        sids.sort()
+        return sids
@@ -0,0 +1,150 @@
+'''Fast reading of word lists and word frequency lists, which may be compressed with gzip, bzip2, or xz. Created on Oct
+17, 2026.
+'''
+
+
+import bz2
+import gzip
+import lzma
+import mmap
+import os
+import re
+import numpy as np
+
+
+BLOCK_SIZE = 1 << 22  # the number of bytes parsed at once
+
+_COMPRESSED_OPENERS = ((b'\x1f\x8b', gzip.open), (b'BZh', bz2.open), (b'\xfd7zXZ\x00', lzma.open))
+
+_TWO_TABS = re.compile(r'\t[^\n]*\t')  # a line with more than one tab
+
+
+def _get_opener(path):
+    """Return the function opening a compressed file, or None if the file isn't compressed."""
+    with open(path, 'rb') as fin:
+        head = fin.read(6)
+    for magic, opener in _COMPRESSED_OPENERS:
+        if head.startswith(magic):
+            return opener
+    return None
+
+
+def is_compressed(path):
+    """Return whether a file is compressed with gzip, bzip2, or xz."""
+    return _get_opener(path) is not None
+
+
+def open_text(path):
+    """Open a UTF-8 text file for reading, decompressing it if it's compressed with gzip, bzip2, or xz."""
+    opener = _get_opener(path) or open
+    return opener(path, 'rt', encoding='utf-8')
+
+
+def iter_blocks(path, block_size=BLOCK_SIZE):
+    """Yield the contents of a file (decompressed if needed) in blocks of bytes that end at the end of a line.
+
+    Blocks are about `block_size` bytes, or longer if a line is. Plain files are memory-mapped rather than read.
+    """
+    opener = _get_opener(path)
+    if opener is None:
+        yield from _iter_mapped_blocks(path, block_size)
+        return
+    with opener(path, 'rb') as fin:
+        rest = b''
+        for block in iter(lambda: fin.read(block_size), b''):
+            end = block.rfind(b'\n') + 1
+            if end:
+                yield rest + block[:end]
+                rest = block[end:]
+            else:
+                rest += block
+        if rest:
+            yield rest
+
+
+def _iter_mapped_blocks(path, block_size):
+    """Yield the blocks of a plain file (see iter_blocks), memory-mapping it."""
+    with open(path, 'rb') as fin:
+        size = os.fstat(fin.fileno()).st_size
+        if not size:
+            return
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            start = 0
+            while start < size:
+                end = data.find(b'\n', min(start + block_size, size) - 1) + 1 or size
+                yield data[start:end]
+                start = end
+
+
+def _split_block(block):
+    """Return the words of the non-blank lines of a block and their frequencies (None for lines without one), as
+    strings."""
+    text = block.decode('utf-8')
+    fields = text.split()
+    # most files have a word and a tab-separated frequency, or just a word, on each line, so the fields of the whole
+    # block are split at once if the counts of fields and whitespace characters show that it has that layout; other
+    # layouts are split line by line
+    num_newlines = text.count('\n')
+    num_lines = num_newlines + (not text.endswith('\n'))
+    num_spaces = len(text) - len(''.join(fields))
+    if len(fields) == num_lines and num_spaces == num_newlines:
+        return fields, [None] * num_lines
+    if (len(fields) == 2 * num_lines and num_spaces == num_lines + num_newlines and text.count('\t') == num_lines
+            and not _TWO_TABS.search(text)):
+        return fields[0::2], fields[1::2]
+    words = []
+    freqs = []
+    for line in text.split('\n'):
+        splitline = line.split()
+        if splitline:
+            words.append(splitline[0])
+            freqs.append(splitline[1] if len(splitline) > 1 else None)
+    return words, freqs
+
+
+def _parse_freqs(freqs, path):
+    """Convert the frequencies of a block to ints."""
+    if None in freqs:
+        raise ValueError('%s: line without a frequency' % path)
+    return list(map(int, freqs))
+
+
+def iter_word_freqs(path, block_size=BLOCK_SIZE):
+    """Lazily read a file where each line contains a word and its frequency count, separated by whitespace (see
+    iter_blocks), yielding tuples of the form (word, freq). Blank lines are skipped."""
+    for block in iter_blocks(path, block_size):
+        words, freqs = _split_block(block)
+        yield from zip(words, _parse_freqs(freqs, path))
+
+
+def read_word_freq_list(infile):
+    """Read a file where each line contains a word and its frequency count, tab-separated.
+
+    Returns a list of tuples of the form (word, freq).
+    """
+    return list(iter_word_freqs(infile))
+
+
+def read_word_freq_arrays(path, block_size=BLOCK_SIZE):
+    """Read a word frequency list (see iter_word_freqs) as a list of words and a numpy array of their frequencies."""
+    words = []
+    freqs = []
+    for block in iter_blocks(path, block_size):
+        block_words, block_freqs = _split_block(block)
+        words.extend(block_words)
+        freqs.append(np.array(_parse_freqs(block_freqs, path), dtype=np.int64))
+    return words, np.concatenate(freqs) if freqs else np.zeros(0, dtype=np.int64)
+
+
+def iter_word_list(infile, block_size=BLOCK_SIZE):
+    """Read the words of a file where each line starts with a word (see read_word_list) lazily, one at a time."""
+    for block in iter_blocks(infile, block_size):
+        yield from _split_block(block)[0]
+
+
+def read_word_list(infile):
+    """Read a file where each line starts with a word (optionally followed by its frequency, which is ignored).
+
+    Returns a list of words.
+    """
+    return list(iter_word_list(infile))
@@ -0,0 +1,63 @@
+'''Pools of worker processes that share read-only state with the parent process. Created on Oct 17, 2026.
+'''
+
+
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+
+
+_shared = None  # the object shared with worker processes by worker_pool
+PENDING_TASKS_PER_WORKER = 2  # how many tasks imap_bounded keeps submitted for each worker
+
+
+@contextmanager
+def worker_pool(shared, num_workers):
+    """Create a pool of `num_workers` worker processes, in which `shared` can be read with get_shared."""
+    global _shared
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # forked workers inherit the object from this process, so nothing is pickled
+        _shared = shared
+        try:
+            with multiprocessing.get_context('fork').Pool(num_workers) as pool:
+                yield pool
+        finally:
+            _shared = None
+    else:
+        # otherwise, send the object to each worker once when it starts, rather than with every task
+        with multiprocessing.Pool(num_workers, initializer=_init_worker, initargs=(shared,)) as pool:
+            yield pool
+
+
+def _init_worker(shared):
+    """Store the shared object in this worker process."""
+    global _shared
+    _shared = shared
+
+
+def get_shared():
+    """Return the object shared with this worker process by worker_pool."""
+    return _shared
+
+
+def imap_bounded(pool, func, items, num_workers):
+    """Yield func(item) for each item of an iterable, in order, computed in a pool of `num_workers` processes.
+
+    Unlike pool.imap, which submits every item as soon as it can, only PENDING_TASKS_PER_WORKER tasks per worker are
+    submitted ahead of the result being consumed, so neither the items nor the results pile up in memory when the
+    consumer is slower than the workers.
+    """
+    pending = deque()
+    max_pending = PENDING_TASKS_PER_WORKER * num_workers
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (item,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def split_list(item_list, num_workers):
+    """Split a list into contiguous chunks, several per worker to balance the load."""
+    chunk_size = max(1, -(-len(item_list) // (num_workers * 4)))
+    return [item_list[i:i+chunk_size] for i in range(0, len(item_list), chunk_size)]